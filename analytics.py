@@ -0,0 +1,339 @@
+import numpy as np
+import pandas as pd
+
+import sketch
+
+# ─────────────────────────────
+# Customer retention & segments
+# ─────────────────────────────
+SEGMENT_LABELS = ["New (1 order month)", "Repeat (2–4 order months)", "Loyal (5+ order months)"]
+
+
+def _month_index(months: pd.Series) -> np.ndarray:
+    """Months as integers (year * 12 + month - 1) so month differences are plain subtraction."""
+    m = pd.to_datetime(months)
+    return (m.dt.year * 12 + m.dt.month - 1).to_numpy(dtype="int64")
+
+
+def _month_from_index(idx) -> pd.DatetimeIndex:
+    idx = np.asarray(idx, dtype="int64")
+    return pd.to_datetime(pd.DataFrame({"year": idx // 12, "month": idx % 12 + 1, "day": 1}))
+
+
+def customer_metrics(tx: pd.DataFrame) -> dict:
+    """
+    Cohort retention, repeat-purchase rate and engagement segments from
+    customer-month revenue (customer_id, order_month, revenue), computed together.
+
+    customer_order_data.txt already aggregates to one row per active customer-month;
+    raw order lines are accepted too and reduced the same way. Every output is derived
+    from that frame with integer month arithmetic. Undated rows are ignored.
+
+    With a weight column (a customer sample stratified by cohort and size, see
+    queries/preview/customer_order_data.txt) customers count with their weight and
+    the dict adds the 95% half-width of the repeat rate ("repeat_rate_error", in points),
+    over the sample's strata (a stratum column) or else the customers' cohorts.
+    """
+    tx = tx.dropna(subset=["order_month"])
+    weighted = "weight" in tx
+    if tx.empty:
+        # no transactions (e.g. a header-only sales.csv): empty tables, zero customers
+        metrics = {
+            "cohort_retention": pd.DataFrame(index=pd.Index([], name="cohort_month"),
+                                             columns=pd.Index([], dtype="int64", name="period_number")),
+            "total_customers": 0,
+            "repeat_customers": 0,
+            "repeat_rate": 0,
+            "seg_table": pd.DataFrame({"segment": pd.Series(dtype=object), "Customers": pd.Series(dtype="int64"),
+                                       "Revenue": pd.Series(dtype="float64"), "Avg_Orders": pd.Series(dtype="float64")}),
+        }
+        if weighted:
+            metrics["repeat_rate_error"] = 0.0
+        return metrics
+    cm = (
+        pd.DataFrame({
+            "customer_id": tx["customer_id"].to_numpy(),
+            "month_idx": _month_index(tx["order_month"]),
+            "revenue": tx["revenue"].to_numpy(),
+            "weight": tx["weight"].to_numpy(dtype="float64") if weighted else 1,
+        })
+        .groupby(["customer_id", "month_idx"], as_index=False, sort=False)
+        .agg({"revenue": "sum", "weight": "max"})
+    )
+
+    # Cohort = first active month; period = months since then. Rows are unique per
+    # customer-month, so summing their weights counts distinct active customers.
+    cohort_idx = cm.groupby("customer_id")["month_idx"].transform("min").to_numpy()
+    period = cm["month_idx"].to_numpy() - cohort_idx
+    cohort_counts = (
+        pd.DataFrame({"cohort_month": cohort_idx, "period_number": period, "weight": cm["weight"].to_numpy()})
+        .groupby(["cohort_month", "period_number"])["weight"].sum()
+        .unstack(fill_value=0)
+    )
+    cohort_retention = cohort_counts.div(cohort_counts[0], axis=0).fillna(0)
+    cohort_retention.index = pd.Index(_month_from_index(cohort_retention.index), name="cohort_month")
+
+    # Per-customer activity feeds both the repeat rate and the segments
+    per_customer = cm.assign(cohort=cohort_idx).groupby("customer_id").agg(
+        orders=("month_idx", "size"), revenue=("revenue", "sum"), weight=("weight", "first"), cohort=("cohort", "first"))
+    weight = per_customer["weight"]
+    repeat = per_customer["orders"] >= 2
+    total_customers = int(round(weight.sum()))
+    repeat_customers = int(round(weight[repeat].sum()))
+    repeat_rate = (weight[repeat].sum() / weight.sum() * 100) if total_customers else 0
+
+    orders = per_customer["orders"].to_numpy()
+    seg_table = (
+        per_customer.assign(
+            segment=np.select([orders == 1, orders <= 4], SEGMENT_LABELS[:2], SEGMENT_LABELS[2]),
+            Customers=weight, Revenue=per_customer["revenue"] * weight, Order_Months=per_customer["orders"] * weight)
+        .groupby("segment", as_index=False)[["Customers", "Revenue", "Order_Months"]].sum()
+        .sort_values("Revenue", ascending=False)
+    )
+    seg_table["Avg_Orders"] = seg_table.pop("Order_Months") / seg_table["Customers"]
+    seg_table["Customers"] = seg_table["Customers"].round().astype("int64")
+    total_rev_all = seg_table["Revenue"].sum()
+    if total_rev_all:
+        seg_table["Revenue Share"] = seg_table["Revenue"] / total_rev_all
+
+    metrics = {
+        "cohort_retention": cohort_retention,
+        "total_customers": total_customers,
+        "repeat_customers": repeat_customers,
+        "repeat_rate": repeat_rate,
+        "seg_table": seg_table,
+    }
+    if weighted:
+        # the strata the sample was drawn from (see ingest.SAMPLE_SELECT); they don't
+        # follow from the rows in view, e.g. in a month window
+        stratum = tx.groupby("customer_id")["stratum"].first().reindex(per_customer.index) \
+            if "stratum" in tx else per_customer["cohort"]
+        strata = per_customer.assign(repeat=repeat, stratum=stratum).groupby("stratum").agg(
+            size=("weight", "sum"), sampled=("weight", "size"), hits=("repeat", "sum"))
+        _, error = sketch.stratified_share(strata["size"], strata["sampled"], strata["hits"])
+        metrics["repeat_rate_error"] = error * 100
+    return metrics
+
+
+def preview_customer_metrics(sample_months: pd.DataFrame, sketches: pd.DataFrame) -> dict:
+    """
+    customer_metrics() of the stratified customer sample for the fast preview, with
+    the total from the merged monthly HyperLogLog sketches of customers (month_year,
+    customers) and the repeat count scaled to it. Adds "total_customers_error" (95%
+    half-width) and "sample_customers".
+    """
+    metrics = customer_metrics(sample_months)
+    registers = sketch.hll_merge([sketch.from_blob(b) for b in sketches["customers"]]) if len(sketches) else \
+        np.zeros(1 << sketch.HLL_PRECISION, dtype="uint8")
+    total = sketch.hll_count(registers)
+    metrics["total_customers"] = int(round(total))
+    metrics["total_customers_error"] = total * sketch.hll_error(registers)
+    metrics["repeat_customers"] = int(round(total * metrics["repeat_rate"] / 100))
+    metrics["sample_customers"] = int(sample_months["customer_id"].nunique())
+    return metrics
+
+
+def preview_kpi(sample_months: pd.DataFrame, sketches: pd.DataFrame) -> pd.DataFrame:
+    """
+    Monthly KPIs in the shape of main_kpi_summary.txt, estimated for the fast preview:
+    revenue and units from the stratified customer sample (customer_id, order_month,
+    revenue, units, weight, stratum), orders exactly from each month's sale count in the sketch
+    table (month_year, sales). Each KPI column has a <column>_error column with its
+    95% half-width.
+    """
+    tx = sample_months.dropna(subset=["order_month"])
+    cm = pd.DataFrame({
+        "customer_id": tx["customer_id"].to_numpy(),
+        "month_idx": _month_index(tx["order_month"]),
+        "revenue": tx["revenue"].to_numpy(dtype="float64"),
+        "units": tx["units"].to_numpy(dtype="float64"),
+        "weight": tx["weight"].to_numpy(dtype="float64"),
+    })
+    # strata the sample was drawn from (else the cohorts in view): sampled customers and their population
+    cm["stratum"] = tx["stratum"].to_numpy() if "stratum" in tx else \
+        cm.groupby("customer_id")["month_idx"].transform("min")
+    customers = cm.groupby("customer_id").agg(stratum=("stratum", "first"), weight=("weight", "first"))
+    strata = customers.groupby("stratum").agg(size=("weight", "sum"), sampled=("weight", "size"))
+    cells = (
+        cm.assign(revenue_sq=cm["revenue"] ** 2, units_sq=cm["units"] ** 2)
+        .groupby(["month_idx", "stratum"])[["revenue", "revenue_sq", "units", "units_sq"]].sum()
+        .join(strata, on="stratum")
+    )
+    rows = []
+    for month_idx, g in cells.groupby(level="month_idx"):
+        revenue, revenue_error = sketch.stratified_total(g["size"], g["sampled"], g["revenue"], g["revenue_sq"])
+        units, units_error = sketch.stratified_total(g["size"], g["sampled"], g["units"], g["units_sq"])
+        rows.append({"month_idx": month_idx, "total_revenue": revenue, "total_revenue_error": revenue_error,
+                     "units_sold": units, "units_sold_error": units_error})
+    estimates = pd.DataFrame(rows, columns=["month_idx", "total_revenue", "total_revenue_error",
+                                            "units_sold", "units_sold_error"])
+    estimates["month_year"] = _month_from_index(estimates["month_idx"]).dt.strftime("%Y-%m").to_numpy()
+
+    # sale_id is unique, so each month's sale count is its exact order count
+    orders = pd.DataFrame({
+        "month_year": sketches["month_year"].astype(str).to_numpy(),
+        "total_orders": sketches["sales"].to_numpy(dtype="int64"),
+    })
+    kpi = orders.merge(estimates.drop(columns="month_idx"), on="month_year", how="left").fillna(0)
+    kpi["total_orders_error"] = 0
+    kpi["average_order_value"] = (kpi["total_revenue"] / kpi["total_orders"]).round(2)
+    # orders are exact, so the ratio carries only the revenue error
+    kpi["average_order_value_error"] = kpi["total_revenue_error"] / kpi["total_orders"]
+    return kpi[["month_year", "total_revenue", "total_orders", "units_sold", "average_order_value",
+                "total_revenue_error", "total_orders_error", "units_sold_error", "average_order_value_error"]]
+
+
+# ─────────────────────────────
+# Per-store slices
+# ─────────────────────────────
+def store_index(kpi_df: pd.DataFrame, category_df: pd.DataFrame, products_df: pd.DataFrame,
+                coverage_df: pd.DataFrame | None = None) -> dict:
+    """
+    Split all-store results (each with a store_name column) into
+    {store_name: {"kpi", "category", "products"[, "coverage"]}} so a store switch
+    is a dict lookup. Stores missing from a result get an empty frame with the same columns.
+    """
+    parts = {"kpi": kpi_df, "category": category_df, "products": products_df}
+    if coverage_df is not None:
+        parts["coverage"] = coverage_df
+    index = {}
+    for part, df in parts.items():
+        for store, g in df.groupby("store_name", sort=False, observed=True):
+            index.setdefault(store, {})[part] = g.drop(columns="store_name").reset_index(drop=True)
+    empty = {part: df.drop(columns="store_name").iloc[0:0] for part, df in parts.items()}
+    for slices in index.values():
+        for part, frame in empty.items():
+            slices.setdefault(part, frame)
+    index[None] = empty  # fallback for stores without any sales
+    return index
+
+
+# ─────────────────────────────
+# Inventory risk
+# ─────────────────────────────
+class StockRiskIndex:
+    """
+    The low-stock risk query result (product_name, category, avg_stock,
+    avg_monthly_sales, stock_coverage) sorted once per category by stock percentile
+    and by coverage, so any cutoff/coverage/category combination is answered with
+    two binary searches per category and a gather of the flagged rows.
+    """
+
+    def __init__(self, stock_df: pd.DataFrame):
+        d = stock_df.copy()
+        d["risk_percentile"] = d.groupby("category", observed=True)["avg_stock"].rank(method="min", pct=True)
+        # Rows in output order; each category is a contiguous block ordered by percentile (NaN last)
+        self.rows = d.sort_values(["category", "risk_percentile", "stock_coverage"]).reset_index(drop=True)
+        self.categories = sorted(self.rows["category"].dropna().unique().tolist())
+        self._percentile = self.rows["risk_percentile"].to_numpy(dtype="float64")
+        self._coverage = self.rows["stock_coverage"].fillna(0).to_numpy(dtype="float64")
+        self._blocks = {}  # category -> (block start, row positions sorted by coverage)
+        for category, idx in self.rows.groupby("category", observed=True, dropna=False).indices.items():
+            self._blocks[category] = (idx[0], idx[np.argsort(self._coverage[idx], kind="stable")])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def nbytes(self) -> int:
+        positions = sum(by_coverage.nbytes for _, by_coverage in self._blocks.values())
+        return (int(self.rows.memory_usage(index=True, deep=True).sum()) + self._percentile.nbytes
+                + self._coverage.nbytes + positions)
+
+    def query(self, pct: float, cov_threshold: float, categories=None) -> dict:
+        """Same result as low_stock_risk(stock_df, pct, cov_threshold, categories)."""
+        keys = self._blocks if categories is None else [c for c in categories if c in self._blocks]
+        flagged, total = [], 0
+        for category in keys:
+            start, by_coverage = self._blocks[category]
+            total += len(by_coverage)
+            n_low = np.searchsorted(self._percentile[start:start + len(by_coverage)], pct / 100.0, side="right")
+            n_cov = np.searchsorted(self._coverage[by_coverage], cov_threshold, side="right")
+            flagged += [np.arange(start, start + n_low), by_coverage[:n_cov]]
+        rows = np.unique(np.concatenate(flagged)) if flagged else np.array([], dtype="int64")
+
+        flag_percentile = self._percentile[rows] <= pct / 100.0
+        flag_coverage = self._coverage[rows] <= cov_threshold
+        at_risk = self.rows.take(rows).reset_index(drop=True)
+        at_risk["Risk Reason"] = np.select(
+            [flag_percentile & flag_coverage, flag_percentile], ["Both", "Percentile"], "Coverage").astype(object)
+        return {"at_risk": at_risk, "total_skus": total}
+
+
+def low_stock_risk(stock_df: pd.DataFrame, pct: float, cov_threshold: float, categories=None) -> dict:
+    """
+    Flag SKUs in the bottom `pct`% of average stock within their category, or with
+    stock coverage at or below `cov_threshold` months, from the low-stock risk query
+    (product_name, category, avg_stock, avg_monthly_sales, stock_coverage).
+    Percentiles are ranked among the selected categories only.
+    Returns {"at_risk": flagged rows with risk_percentile and Risk Reason, "total_skus"}.
+    For repeated thresholds on the same data, build a StockRiskIndex once instead.
+    """
+    return StockRiskIndex(stock_df).query(pct, cov_threshold, categories)
+
+
+def stock_coverage(levels_df: pd.DataFrame) -> pd.DataFrame:
+    """Category stock levels plus coverage = avg_stock / avg_monthly_sales in months (NA without sales)."""
+    d = levels_df.copy()
+    d["coverage"] = (d["avg_stock"] / d["avg_monthly_sales"].replace(0, pd.NA)).fillna(pd.NA)
+    return d
+
+
+# ─────────────────────────────
+# Customers by revenue
+# ─────────────────────────────
+def top_customers(revenue_df: pd.DataFrame, categories=None, top_n: int = 5) -> pd.DataFrame:
+    """
+    The `top_n` customers by revenue summed over `categories` (all categories when
+    empty), each with the sorted list of categories they bought in, from customer x
+    category revenue (customer_name, category, total_revenue). Ties go by name.
+    """
+    df = revenue_df[revenue_df["category"].isin(categories)] if categories else revenue_df
+    agg = (
+        df.groupby("customer_name", observed=True)
+        .agg(
+            total_revenue=("total_revenue", "sum"),
+            categories=("category", lambda x: ", ".join(sorted(set(x))))
+        )
+        .reset_index()
+    )
+    return agg.sort_values(["total_revenue", "customer_name"], ascending=[False, True]).head(top_n)
+
+
+def top_customer_rows(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    top_customers() output from the rows of customer_top_k.txt (customer_name,
+    total_revenue, category), which has one row per winner and category bought,
+    already ranked by the engine.
+    """
+    return (
+        rows.groupby(["customer_name", "total_revenue"], sort=False, observed=True)["category"]
+        .agg(", ".join)
+        .reset_index(name="categories")
+    )
+
+
+# ─────────────────────────────
+# Pareto
+# ─────────────────────────────
+def pareto(df: pd.DataFrame, category_col: str = "category", value_col: str = "revenue", cutoff: float = 0.80) -> dict:
+    """
+    Totals per category sorted descending with cumulative share (cum_pct), plus the
+    smallest set of categories reaching `cutoff` of the total:
+    {"table", "cutoff_idx", "top_k", "pct", "top_labels"}.
+    """
+    d = df[[category_col, value_col]].dropna()
+    d = d.groupby(category_col, as_index=False, observed=True)[value_col].sum()
+    d = d.sort_values(value_col, ascending=False).reset_index(drop=True)
+    total = d[value_col].sum()
+    d["cum_value"] = d[value_col].cumsum()
+    d["cum_pct"] = d["cum_value"] / (total if total else 1)
+
+    # first row where the cumulative share reaches the cutoff
+    cutoff_idx = int((d["cum_pct"] >= cutoff).idxmax()) if len(d) else 0
+    return {
+        "table": d,
+        "cutoff_idx": cutoff_idx,
+        "top_k": cutoff_idx + 1 if len(d) else 0,
+        "pct": float(d.loc[cutoff_idx, "cum_pct"]) if len(d) else 0.0,
+        "top_labels": d.loc[:cutoff_idx, category_col].tolist() if len(d) else [],
+    }
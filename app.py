@@ -1,11 +1,24 @@
+import hashlib
+import json
 import os
-import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+import analytics
+import cache
+import datasets
+import db
+import ingest
+import perf
+import star
+
 # ─────────────────────────────
 # App & Paths
 # ─────────────────────────────
@@ -13,66 +26,309 @@ st.set_page_config(page_title="Data Analysis Dashboard", layout="wide")
 
 DB_PATH = "retail_sales.db"
 CSV_DIR = "csv_files"
-
-TABLES = ["customers", "inventory", "products", "sales", "stores"]
+QUERY_DIR = "queries"
+
+# Read the dashboard aggregates from the pre-aggregated sales_monthly table
+# (queries/rollup/) instead of re-joining raw sales.
+USE_ROLLUP = True
+
+# Read-only connection pool shared by all sessions; the build step has its own writer.
+POOL_SIZE = 4
+MMAP_SIZE = 256 * 1024 * 1024  # bytes
+CACHE_SIZE_KIB = 64 * 1024
+
+# Query engine: "sqlite" (the pooled read-only connections) or "duckdb", which runs
+# the same query files over a Parquet export written at build time (needs duckdb).
+ENGINE = "sqlite"
+COLUMNAR_DIR = "columnar"
+
+# Return query results as compact frames: low-cardinality strings as categoricals,
+# int64 as int32 where it fits, floats as float32 where exact. SQLite results are
+# fetched in batches into Arrow columns, straight from the driver when
+# adbc-driver-sqlite is installed (see db.open_reader).
+COMPACT_RESULTS = True
+
+# Results written by precompute.py; used instead of live queries when they match the data version
+PRECOMPUTED_DIR = "precomputed"
+
+# Timing records of query runs and builds (rolling buffer); set QUERY_LOG_PATH to
+# also append them as JSON lines. The Performance panel shows with ?perf=1 in the URL.
+QUERY_LOG_SIZE = 2000
+QUERY_LOG_PATH = None
+
+# Query results shared across sessions, keyed by the versions of the tables they read (LRU)
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_BYTES = 1024 ** 3
+# ...backed by Arrow files on disk, so a restart starts warm (None disables the disk tier)
+RESULT_DISK_CACHE_DIR = ".cache/results"
+RESULT_DISK_CACHE_BYTES = 2 * 1024 ** 3
+
+# Customer sections read a shared in-memory star schema (customer x month x category
+# revenue aggregated in SQL, as NumPy arrays) instead of the customer query results.
+# Off by default: query results are already shared across sessions by the result cache.
+STAR_SCHEMA = False
+
+# Fast preview (opt-in with the toggle above the page): a section whose exact result
+# isn't ready PREVIEW_BUDGET_SECONDS after the page starts shows an estimate from the
+# HyperLogLog sketches and stratified sample built at ingest, with 95% error bounds,
+# or a placeholder; the page reruns with the exact results once they are all in.
+FAST_PREVIEW = False
+PREVIEW_BUDGET_SECONDS = 1.0
+PREVIEW_POLL_SECONDS = 1.0
+
+# Built Plotly figures kept across reruns and sessions (LRU)
+FIGURE_CACHE_SIZE = 128
+
+TABLES = ingest.TABLES
 
 # Caching functions
 @st.cache_resource
-def get_conn(db_path: str = DB_PATH):
-    # one shared connection per session
-    return sqlite3.connect(db_path, check_same_thread=False)
+def get_writer_conn(db_path: str = DB_PATH):
+    # the only connection that writes; reserved for the build step
+    return db.open_writer(db_path)
 
-@st.cache_data(ttl=300)
-def load_sql(path: str) -> str:
+@st.cache_resource
+def get_pool(db_path: str = DB_PATH):
+    # read-only connections shared across sessions and script threads
+    return db.ConnectionPool(db_path, size=POOL_SIZE, mmap_size=MMAP_SIZE, cache_size_kib=CACHE_SIZE_KIB)
+
+@st.cache_resource
+def get_engine():
+    if ENGINE == "duckdb":
+        return db.DuckDBEngine(COLUMNAR_DIR, threads=POOL_SIZE, compact=COMPACT_RESULTS)
+    return db.SQLiteEngine(get_pool(), compact=COMPACT_RESULTS)
+
+@st.cache_data(show_spinner=False)
+def _read_sql(path: str, mtime: float) -> str:
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-@st.cache_data(ttl=300)
+def load_sql(path: str) -> str:
+    # re-read only when the file changes
+    return _read_sql(path, os.path.getmtime(path))
+
+def query_sql(name: str) -> str:
+    """SQL for a query file: its rollup variant and engine dialect override when present."""
+    path = datasets.query_path(QUERY_DIR, name, get_engine().dialect, USE_ROLLUP)
+    sql = load_sql(path)
+    get_query_log().name(sql, os.path.relpath(path, QUERY_DIR).replace(os.sep, "/"))
+    return sql
+
+def window_sql(name: str, months: tuple[str, str] | None) -> tuple[str, tuple | None]:
+    """(sql, leading params) of a query file restricted to the months first..last; see ingest.restrict_months()."""
+    sql = query_sql(name)
+    windowed, params = ingest.restrict_months(sql, months)
+    if params:
+        log = get_query_log()
+        log.name(windowed, log.name_of(sql))
+    return windowed, params or None
+
+@st.cache_resource
+def get_query_log():
+    return perf.QueryLog(max_records=QUERY_LOG_SIZE, jsonl_path=QUERY_LOG_PATH)
+
+# Set by the bodies of cached functions, which only run on a cache miss
+_cache_miss = threading.local()
+
+def timed(fn, *args):
+    """Call a cached function and return (result, wall seconds, served from cache)."""
+    _cache_miss.ran = False
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started, not _cache_miss.ran
+
+@st.cache_resource
+def get_result_cache():
+    return cache.ResultCache(max_entries=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_BYTES)
+
+@st.cache_resource
+def get_disk_cache():
+    if RESULT_DISK_CACHE_DIR is None:
+        return None
+    # results on disk outlive a deploy: key them by the code that builds tables and result frames too,
+    # and by every query file (window shadows live in ingest.py)
+    digest = hashlib.sha1()
+    for m in (ingest, db, analytics):
+        with open(m.__file__, "rb") as f:
+            digest.update(f.read())
+    for path in sorted(os.path.join(root, f) for root, _, files in os.walk(QUERY_DIR) for f in files):
+        # named too, so moving a query file between variants changes the version
+        digest.update(os.path.relpath(path, QUERY_DIR).replace(os.sep, "/").encode() + b"\0")
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    build_version = digest.hexdigest()[:12]
+    return cache.DiskCache(RESULT_DISK_CACHE_DIR, max_bytes=RESULT_DISK_CACHE_BYTES, build_version=build_version)
+
+def _query_through_disk(sql: str, params: tuple | None, versions: dict) -> pd.DataFrame:
+    # memory miss: try the disk tier before running the query
+    disk = get_disk_cache()
+    if disk is None:
+        return get_engine().query(sql, params)
+    df = disk.get((sql, params), versions)
+    if df is None:
+        df = get_engine().query(sql, params)
+        disk.put((sql, params), versions, df)
+    return df
+
+def _versions(sql: str) -> dict:
+    # current version of each table the query reads
+    return {t: table_versions[t] for t in ingest.tables_read(sql)}
+
 def run_query(sql: str, params: tuple | None = None) -> pd.DataFrame:
-    # cached returned DataFrames; params become cache key
-    conn = get_conn()
-    return pd.read_sql_query(sql, conn, params=params)
-
-@st.cache_data(ttl=300)
-def read_csv_table(name: str) -> pd.DataFrame:
-    return pd.read_csv(os.path.join(CSV_DIR, f"{name}.csv"))
-
-def _csv_signature() -> tuple:
-    """Lightweight signature so cache/refresh decision can be made (mtime,size)."""
-    sig = []
-    for t in TABLES:
-        p = os.path.join(CSV_DIR, f"{t}.csv")
-        stat = os.stat(p)
-        sig.append((t, stat.st_mtime, stat.st_size))
-    return tuple(sig)
+    """
+    Query results, cached until a table the query reads changes (sql and params are
+    part of the key). Results are shared across sessions: treat them as read-only.
+    Every call lands in the query log.
+    """
+    started = time.perf_counter()
+    versions = _versions(sql)
+    # the size is measured once, when the result is computed, not on every hit
+    df, cache_hit, nbytes = get_result_cache().get_or_compute_sized(
+        ("query", sql, params), versions, lambda: _query_through_disk(sql, params, versions))
+    log = get_query_log()
+    log.record("query", log.name_of(sql), time.perf_counter() - started, cache_hit,
+               rows=len(df), nbytes=nbytes, saved_bytes=df.attrs.get("bytes_saved"))
+    return df
+
+def customer_metrics(sql: str, params: tuple | None = None) -> dict:
+    # cohort/repeat/segment outputs share one pass over the customer order lines
+    metrics, _ = get_result_cache().get_or_compute(
+        ("customer_metrics", sql, params), _versions(sql), lambda: analytics.customer_metrics(run_query(sql, params)))
+    return metrics
+
+def stock_risk_index(sql: str, params: tuple | None = None) -> analytics.StockRiskIndex:
+    # sorted once per version of the low-stock query result; every slider move reuses it
+    index, _ = get_result_cache().get_or_compute(
+        ("stock_risk_index", sql, params), _versions(sql), lambda: analytics.StockRiskIndex(run_query(sql, params)))
+    return index
+
+def preview_customer_metrics(months: tuple[str, str] | None) -> dict:
+    # customer metrics estimated from the stratified sample, total customers from the sketches
+    sample, sketches = window_sql("preview/customer_order_data", months), window_sql("preview/sales_sketch", months)
+    metrics, _ = get_result_cache().get_or_compute(
+        ("preview_customer_metrics", sample, sketches), _versions(sample[0] + sketches[0]),
+        lambda: analytics.preview_customer_metrics(run_query(*sample), run_query(*sketches)))
+    return metrics
+
+def preview_kpi(months: tuple[str, str] | None) -> pd.DataFrame:
+    # monthly KPIs estimated from the stratified sample and the monthly order sketches
+    sample, sketches = window_sql("preview/customer_order_data", months), window_sql("preview/sales_sketch", months)
+    kpi, _ = get_result_cache().get_or_compute(
+        ("preview_kpi", sample, sketches), _versions(sample[0] + sketches[0]),
+        lambda: analytics.preview_kpi(run_query(*sample), run_query(*sketches)))
+    return kpi
+
+@st.cache_resource
+def get_figure_cache():
+    return cache.FigureCache(max_entries=FIGURE_CACHE_SIZE)
+
+def cached_figure(builder, df: pd.DataFrame, **params):
+    # rebuilt only when the builder, its input data or its parameters change
+    return get_figure_cache().get_or_build(builder, df, **params)
+
+@st.cache_resource(max_entries=4)
+def get_store_index(data_version: str, months: tuple[str, str] | None = None) -> dict:
+    """
+    Monthly KPIs, category revenue, top-15 products and stock coverage for every
+    store, computed in one grouped pass per data version and date range and
+    shared read-only across sessions.
+    """
+    return analytics.store_index(
+        run_query(*window_sql("store_index_kpi", months)),
+        run_query(*window_sql("store_index_category", months)),
+        run_query(*window_sql("store_index_products", months)),
+        run_query(*window_sql("store_index_coverage", months)),
+    )
+
+@st.cache_resource(max_entries=1)
+def get_star_schema(version: str) -> star.StarSchema:
+    """
+    Customer revenue cells and the customer dimension as read-only NumPy arrays,
+    built once per version of the star's tables and shared by every session without copies.
+    """
+    started = time.perf_counter()
+    model = star.build_star(get_engine())
+    get_query_log().record("build", "star_schema", time.perf_counter() - started, False,
+                           rows=len(model), nbytes=model.nbytes())
+    return model
+
+@st.cache_resource(max_entries=4)
+def get_customer_metrics(version: str, months: tuple[str, str] | None = None) -> dict:
+    return analytics.customer_metrics(get_star_schema(version).customer_months(months))
+
+@st.cache_resource(max_entries=2)
+def get_precomputed(data_version: str, manifest_mtime: float | None) -> dict | None:
+    """
+    Page data from PRECOMPUTED_DIR in the shape the sections expect, or None when
+    precompute.py hasn't produced results for this data version.
+    """
+    results = datasets.read_results(PRECOMPUTED_DIR, data_version) if manifest_mtime else None
+    if results is None:
+        return None
+    page = {key: results[key] for key in
+            ["kpi", "top_category", "region_category", "all_stores", "low_stock", "stock_levels", "customer_revenue"]}
+    page["low_stock"] = analytics.StockRiskIndex(results["low_stock"])
+    page["store_index"] = datasets.store_index(results)
+    page["customer_metrics"] = datasets.customer_metrics(results)
+    return page
+
+def resolved(value) -> Future:
+    # an already finished Future, so sections treat precomputed and prefetched data alike
+    future = Future()
+    future.set_result(value)
+    return future
+
+@st.cache_resource
+def get_query_executor():
+    # independent page queries run side by side, at most one per pooled connection
+    return ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="query")
+
+def prefetch(jobs: dict) -> dict[str, Future]:
+    """
+    Submit {key: (cached function, *args)} to the query executor and return {key: Future}.
+    Sections call .result() where they need the data, so a cold page waits for the
+    slowest query rather than the sum of all of them.
+    """
+    ctx = get_script_run_ctx()
+
+    def task(fn, *args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    executor = get_query_executor()
+    return {key: executor.submit(task, *job) for key, job in jobs.items()}
 
 @st.cache_data(show_spinner=False)
 def build_database_if_needed(sig: tuple):
     """
-    Rebuild tables from CSVs into SQLite.
+    Sync SQLite with the CSVs, table by table.
     This function is cached keyed by the CSV signature. If CSVs don't change,
-    this won't run again.
+    this won't run again; when they do, only the changed tables are touched
+    (and appended rows only, for append-only files such as sales.csv).
+    The sales_monthly rollup and the fast-preview sketches and sample are then
+    refreshed and query plans re-recorded so full table scans show up. With the
+    duckdb engine, changed tables are re-exported to Parquet as well.
     """
-    conn = get_conn()
-    for name in TABLES:
-        df = read_csv_table(name)
-
-        # date conversions for sales & inventory
-        if name in ["sales", "inventory"]:
-            if "last_updated" in df.columns:
-                df["last_updated"] = pd.to_datetime(df["last_updated"], errors="coerce").dt.date
-            if "sale_date" in df.columns:
-                df["sale_date"] = pd.to_datetime(df["sale_date"], errors="coerce").dt.date
-
-        df.to_sql(name, conn, if_exists="replace", index=False)
-    return "ok"
+    _cache_miss.ran = True
+    conn = get_writer_conn()
+    tables = ingest.sync_database(conn, CSV_DIR)
+    rollup = ingest.build_rollup(conn, tables)
+    preview = ingest.build_preview(conn, tables)
+    full_scans = ingest.record_query_plans(conn, QUERY_DIR)
+    exported = ingest.export_parquet(conn, COLUMNAR_DIR, tables, rollup, preview) if ENGINE == "duckdb" else {}
+    return {"tables": tables, "rollup": rollup, "preview": preview, "full_scans": full_scans, "exported": exported}
 
 # Controls to rebuild / refresh
 left, right = st.columns([1, 3])
 with left:
     if st.button("🔄 Rebuild database from CSVs"):
-        st.cache_data.clear()  # clear caches so the next call rebuilds
+        ingest.reset_state(get_writer_conn())  # force a full reload instead of an incremental sync
         build_database_if_needed.clear()  # clear build cache specifically
+        if get_disk_cache() is not None:
+            get_disk_cache().clear()  # results on disk may come from an older build of the same data
+        # in-memory results stay cached: they are keyed by table version and pruned below if a table changed
+    fast_preview = st.toggle("⚡ Fast preview", value=FAST_PREVIEW, key="fast_preview",
+                             help="Show estimates with error bounds while the exact results load.")
 
 
 
@@ -80,7 +336,9 @@ masking_dict = {"total_revenue": "Revenue", "total_orders":"Orders", "units_sold
 #Key Performance Indicator Graphing
 def make_kpi_line(df: pd.DataFrame, value_col: str, use_moving_average: bool):
     display_name = masking_dict.get(value_col, value_col)
-    d = df[["month_year", value_col]].copy()
+    # fast-preview estimates carry their 95% half-width in <value_col>_error
+    error_col = f"{value_col}_error" if f"{value_col}_error" in df else None
+    d = df[["month_year", value_col] + ([error_col] if error_col else [])].copy()
     d["month_year"] = pd.to_datetime(d["month_year"]) + pd.offsets.MonthEnd(0)
 
     # Optional 3-month moving average
@@ -92,6 +350,7 @@ def make_kpi_line(df: pd.DataFrame, value_col: str, use_moving_average: bool):
         d,
         x="month_year",
         y=value_col,
+        error_y=error_col,
         markers=True,
         title=display_name,
         labels={"month_year": "Month", value_col: display_name},
@@ -99,20 +358,20 @@ def make_kpi_line(df: pd.DataFrame, value_col: str, use_moving_average: bool):
     if use_moving_average:
         fig.add_scatter(x=d["month_year"], y=d[ma_col], mode="lines", name="3-mo avg")
 
-    # annotations
-    peak = d.loc[d[value_col].idxmax()]
-    low = d.loc[d[value_col].idxmin()]
-
     is_currency = value_col in {"total_revenue", "average_order_value"}
     y_prefix = "$" if is_currency else ""
     hover_val_fmt = "$%{y:,.0f}" if is_currency else "%{y:,.0f}"
 
-    fig.add_annotation(x=peak["month_year"], y=peak[value_col],
-                       text=f"Peak: {y_prefix}{peak[value_col]:,.0f}",
-                       showarrow=True, arrowhead=2, yshift=10)
-    fig.add_annotation(x=low["month_year"], y=low[value_col],
-                       text=f"Low: {y_prefix}{low[value_col]:,.0f}",
-                       showarrow=True, arrowhead=2, yshift=-10)
+    # annotations (none without sales)
+    if d[value_col].notna().any():
+        peak = d.loc[d[value_col].idxmax()]
+        low = d.loc[d[value_col].idxmin()]
+        fig.add_annotation(x=peak["month_year"], y=peak[value_col],
+                           text=f"Peak: {y_prefix}{peak[value_col]:,.0f}",
+                           showarrow=True, arrowhead=2, yshift=10)
+        fig.add_annotation(x=low["month_year"], y=low[value_col],
+                           text=f"Low: {y_prefix}{low[value_col]:,.0f}",
+                           showarrow=True, arrowhead=2, yshift=-10)
 
     fig.update_traces(hovertemplate=f"%{{x|%b %Y}}<br>{display_name}: {hover_val_fmt}")
     fig.update_layout(
@@ -171,20 +430,9 @@ def make_store_trend_fig(df: pd.DataFrame, value_col: str, months_back: int | No
     return fig
 
 def make_pareto_chart(df: pd.DataFrame, category_col: str = "category", value_col: str = "revenue", cutoff: float = 0.80, title: str = "Pareto: Revenue by Category"):
-    d = df[[category_col, value_col]].dropna().copy()
-    d = d.groupby(category_col, as_index=False)[value_col].sum()
-
-    # Sort descending and compute cumulative %
-    d = d.sort_values(value_col, ascending=False).reset_index(drop=True)
-    total = d[value_col].sum()
-    d["cum_value"] = d[value_col].cumsum()
-    d["cum_pct"] = d["cum_value"] / (total if total else 1)
-
-    # Find cutoff index (first row where cum_pct >= cutoff)
-    cutoff_idx = int((d["cum_pct"] >= cutoff).idxmax()) if len(d) else 0
-    top_k = cutoff_idx + 1 if len(d) else 0
-    pct_at_cutoff = float(d.loc[cutoff_idx, "cum_pct"]) if len(d) else 0.0
-    top_labels = d.loc[:cutoff_idx, category_col].tolist() if len(d) else []
+    # Sorted totals, cumulative % and the categories needed to reach the cutoff
+    p = analytics.pareto(df, category_col=category_col, value_col=value_col, cutoff=cutoff)
+    d, cutoff_idx, top_k = p["table"], p["cutoff_idx"], p["top_k"]
 
     # Build figure (bars + cumulative line on secondary y-axis)
     fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -239,15 +487,123 @@ def make_pareto_chart(df: pd.DataFrame, category_col: str = "category", value_co
         secondary_y=True,
     )
 
-    return fig, {"top_k": top_k, "pct": pct_at_cutoff, "top_labels": top_labels}
+    return fig, {"top_k": top_k, "pct": p["pct"], "top_labels": p["top_labels"]}
+
+def make_checkpoint_bars(cohort_retention: pd.DataFrame, checkpoints=(1,2,3), title="Checkpoint Retention by Cohort"):
+    bars = (cohort_retention.copy() * 100)
+    bars = bars[[c for c in bars.columns if c in checkpoints]]
+    bars_long = (
+        bars.reset_index()
+            .melt(id_vars="cohort_month", var_name="Months since first purchase", value_name="Retention %")
+            .dropna()
+    )
+    fig = px.bar(
+        bars_long,
+        x="cohort_month",
+        y="Retention %",
+        color="Months since first purchase",
+        barmode="group",
+        title=title,
+        labels={"cohort_month": "Cohort (first purchase month)"},
+        text=bars_long["Retention %"].round(0).astype(int).astype(str) + "%"
+    )
+    fig.update_traces(textposition="outside", cliponaxis=False)
+    fig.update_xaxes(
+        tickmode="array",
+        tickvals=bars_long["cohort_month"].unique(), 
+        tickangle=-45                            
+    )
+    fig.update_layout(template="plotly_white", margin=dict(l=10, r=10, t=80, b=10))
+    return fig
 
 
 
 # always ensure DB is in sync with CSVs (cached by signature)
-status = build_database_if_needed(_csv_signature())
+signature = ingest.csv_signature(CSV_DIR)
+status, build_seconds, build_cached = timed(build_database_if_needed, signature)
+get_query_log().record("build", "build_database_if_needed", build_seconds, build_cached,
+                       rows=None if build_cached else sum(r["rows"] for r in status["tables"].values()))
+data_version = ingest.data_version(signature)
+table_versions = ingest.table_versions(signature)
+star_version = ingest.data_version(tuple(table_versions[t] for t in star.TABLES))
+if not build_cached:
+    # a build ran: drop cached results of the tables whose CSVs changed, keep the rest
+    get_result_cache().prune(table_versions)
+with right:
+    changed = {t: r for t, r in status["tables"].items() if r["action"] != "skip"}
+    if changed:
+        st.caption("Database synced: " + ", ".join(
+            f"{t} ({r['action']}, {r['rows']:,} rows @ {r['rows_per_sec']:,.0f} rows/s)" for t, r in changed.items()))
+    if status["exported"]:
+        st.caption("Parquet export: " + ", ".join(f"{t} ({n:,} rows)" for t, n in status["exported"].items()))
+    if status["full_scans"]:
+        st.warning("Queries falling back to a full table scan: " + "; ".join(
+            f"{q} ({', '.join(steps)})" for q, steps in status["full_scans"].items()))
 
 st.title("Data Analysis Dashboard")
 
+# Global date range, pushed into every query (and the star schema's customer views);
+# the full range leaves the queries as they are and allows the precomputed results
+data_months = run_query(query_sql("sales_months"))["month"].astype(str).tolist()
+date_window = None
+if len(data_months) > 1:
+    first_month, last_month = st.select_slider("Date range", options=data_months,
+                                               value=(data_months[0], data_months[-1]), key="date_range")
+    if (first_month, last_month) != (data_months[0], data_months[-1]):
+        date_window = (first_month, last_month)
+preview_status = st.container()
+
+# Latency budget of the fast preview, counted from here
+page_deadline = time.perf_counter() + PREVIEW_BUDGET_SECONDS
+pending_exact: list[Future] = []
+PREVIEW_PENDING = "⚡ Fast preview: the exact results of this section are still loading."
+
+def within_budget(future: Future, preview=None):
+    """
+    (result, is_preview). Without the fast preview this waits for the exact result.
+    With it, a result not ready by the page deadline keeps loading in the background
+    and preview() stands in (None without one) until the page reruns with it.
+    """
+    if not fast_preview:
+        return future.result(), False
+    try:
+        return future.result(timeout=max(0.0, page_deadline - time.perf_counter())), False
+    except TimeoutError:
+        pending_exact.append(future)
+        return (preview() if preview else None), True
+
+@st.fragment(run_every=PREVIEW_POLL_SECONDS)
+def exact_results_poller(pending: list[Future]):
+    # checks the background loads; the full rerun swaps the exact results in
+    if all(f.done() for f in pending):
+        st.rerun()
+    st.caption(f"⚡ Fast preview: {sum(not f.done() for f in pending)} result(s) still loading; "
+               "sections show estimates until then.")
+
+# Everything the page needs that doesn't depend on a widget: finished results from
+# precompute.py when they match this data version, otherwise start loading it now
+precomputed = get_precomputed(data_version, datasets.manifest_mtime(PRECOMPUTED_DIR)) if date_window is None else None
+if precomputed is not None:
+    page_data = {key: resolved(value) for key, value in precomputed.items()}
+else:
+    page_data = prefetch({
+        "kpi": (run_query, *window_sql("main_kpi_summary", date_window)),
+        "top_category": (run_query, *window_sql("top_category", date_window)),
+        "region_category": (run_query, *window_sql("region_category_rev", date_window)),
+        "all_stores": (run_query, *window_sql("all_stores_performance", date_window)),
+        "store_index": (get_store_index, data_version, date_window),
+        "low_stock": (stock_risk_index, *window_sql("inventory_tab_low_stock_risk", date_window)),
+        "stock_levels": (run_query, *window_sql("inventory_category_stock_levels", date_window)),
+        **({
+            "customer_metrics": (get_customer_metrics, star_version, date_window),
+            "customer_revenue": (get_star_schema, star_version),
+        } if STAR_SCHEMA else {
+            "customer_metrics": (customer_metrics, *window_sql("customer_order_data", date_window)),
+            # only the category list; top customers are aggregated and limited by the engine
+            "customer_revenue": (run_query, query_sql("customer_categories")),
+        }),
+    })
+
 
 # Main KPIs (use cached run_query)
 st.header("Monthly Key Performance Indicators")
@@ -263,19 +619,25 @@ st.info(
     Use the tabs to switch between metrics and monitor growth, seasonality, and shifts in customer behavior.
     """
 )
-tab1, tab2, tab3, tab4 = st.tabs(["Revenue", "Total Orders", "Units sold", "Average Order Value"])
-
-
-kpi_df = run_query(load_sql("queries/main_kpi_summary.txt"))
 
-with tab1:
-    st.plotly_chart(make_kpi_line(kpi_df, "total_revenue", use_moving_average=True), use_container_width=True)
-with tab2:
-    st.plotly_chart(make_kpi_line(kpi_df, "total_orders", use_moving_average=False), use_container_width=True)
-with tab3:
-    st.plotly_chart(make_kpi_line(kpi_df, "units_sold", use_moving_average=False), use_container_width=True)
-with tab4:
-    st.plotly_chart(make_kpi_line(kpi_df, "average_order_value", use_moving_average=False), use_container_width=True)
+# Each section is a fragment: its widgets rerun only that section, and tabs
+# created with on_change="rerun" only build the content of the open tab.
+@st.fragment
+def kpi_section(kpi_future: Future):
+    kpi_tabs = st.tabs(["Revenue", "Total Orders", "Units sold", "Average Order Value"], key="kpi_tabs", on_change="rerun")
+    kpi_df, is_preview = within_budget(kpi_future, lambda: preview_kpi(date_window))
+    if is_preview:
+        st.caption("⚡ Preview: revenue and units are estimated from a stratified customer sample, orders are "
+                   "exact counts; bars show 95% error bounds.")
+
+    kpi_cols = [("total_revenue", True), ("total_orders", False), ("units_sold", False), ("average_order_value", False)]
+    for tab, (value_col, use_ma) in zip(kpi_tabs, kpi_cols):
+        if tab.open:
+            with tab:
+                st.plotly_chart(cached_figure(make_kpi_line, kpi_df, value_col=value_col, use_moving_average=use_ma),
+                                use_container_width=True)
+
+kpi_section(page_data["kpi"])
 
 st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -290,55 +652,64 @@ st.info(
     """
 )
 
-tab_cat, tab_mix, tab_reg = st.tabs(["Categories (Pareto)", "Region & Category Treemap", "Regional Breakdown"])
-
-# Pareto chart
-with tab_cat:
-    cat_reg_df = run_query(load_sql("queries/top_category.txt"))
-    pareto_fig, info = make_pareto_chart(cat_reg_df, "category", "total_revenue", cutoff=0.80, title="")
-    st.plotly_chart(pareto_fig, use_container_width=True)
-    pct_str = f"{info['pct']*100:.0f}%"
-    st.info(f"Top {info['top_k']} categories make up {pct_str} of revenue: {', '.join(info['top_labels'])}.")
-
-# Treemap diagram
-with tab_mix:
-    rc_df = run_query(load_sql("queries/region_category_rev.txt"))
-    fig_tree = px.treemap(rc_df, path=["region", "category"], values="total_revenue",
-                          title="Revenue by Region and Category")
-    fig_tree.update_traces(hovertemplate="Path: %{label}<br>Revenue: $%{value:,.0f}<extra></extra>")
-    fig_tree.update_layout(template="plotly_white", margin=dict(l=10, r=10, t=80, b=10),
-                           title=dict(x=0.5, xanchor="center", yanchor="top", pad=dict(t=20)))
-    st.plotly_chart(fig_tree, use_container_width=True)
-
-# Stacked bars for category and revenue
-with tab_reg:
-    if 'rc_df' not in locals():
-        rc_df = run_query(load_sql("queries/region_categor_rev.txt"))
-
-    region_totals = rc_df.groupby("region", as_index=False)["total_revenue"].sum()
-    region_order = region_totals.sort_values("total_revenue", ascending=False)["region"].tolist()
-
-    fig_stack = px.bar(rc_df, x="region", y="total_revenue", color="category",
-                       title="Which Regions Make the Most (and What’s Driving It)")
-    fig_stack.update_traces(hovertemplate="%{x}<br>%{fullData.name}: $%{y:,.0f}<extra></extra>")
-    fig_stack.update_layout(barmode="stack", template="plotly_white",
-                            margin=dict(l=10, r=10, t=80, b=10),
-                            title=dict(x=0.5, xanchor="center", yanchor="top", pad=dict(t=20)),
-                            legend_title_text="Category")
-    fig_stack.update_xaxes(categoryorder="array", categoryarray=region_order)
-    fig_stack.update_yaxes(tickprefix="$", separatethousands=True, title_text="Revenue")
-    st.plotly_chart(fig_stack, use_container_width=True)
-
-    # Insight
-    top_region_row = region_totals.loc[region_totals["total_revenue"].idxmax()]
-    top_region, top_region_revenue = top_region_row["region"], top_region_row["total_revenue"]
-    top_cat_row = (rc_df[rc_df["region"] == top_region]
-                   .groupby("category", as_index=False)["total_revenue"].sum()
-                   .sort_values("total_revenue", ascending=False).iloc[0])
-    st.info(
-        f"{top_region} leads with ${top_region_revenue:,.0f}. "
-        f"Within {top_region}, {top_cat_row['category']} contributes {top_cat_row['total_revenue']:,.0f}."
-    )
+@st.fragment
+def category_region_section(category_future: Future, region_future: Future):
+    cat_reg_df, _ = within_budget(category_future)
+    rc_df, _ = within_budget(region_future)
+    if cat_reg_df is None or rc_df is None:
+        st.info(PREVIEW_PENDING)
+        return
+    tab_cat, tab_mix, tab_reg = st.tabs(["Categories (Pareto)", "Region & Category Treemap", "Regional Breakdown"],
+                                        key="category_tabs", on_change="rerun")
+
+    # Pareto chart
+    if tab_cat.open:
+        with tab_cat:
+            pareto_fig, info = cached_figure(make_pareto_chart, cat_reg_df, category_col="category",
+                                            value_col="total_revenue", cutoff=0.80, title="")
+            st.plotly_chart(pareto_fig, use_container_width=True)
+            pct_str = f"{info['pct']*100:.0f}%"
+            st.info(f"Top {info['top_k']} categories make up {pct_str} of revenue: {', '.join(info['top_labels'])}.")
+
+    # Treemap diagram
+    if tab_mix.open:
+        with tab_mix:
+            fig_tree = px.treemap(rc_df, path=["region", "category"], values="total_revenue",
+                                  title="Revenue by Region and Category")
+            fig_tree.update_traces(hovertemplate="Path: %{label}<br>Revenue: $%{value:,.0f}<extra></extra>")
+            fig_tree.update_layout(template="plotly_white", margin=dict(l=10, r=10, t=80, b=10),
+                                   title=dict(x=0.5, xanchor="center", yanchor="top", pad=dict(t=20)))
+            st.plotly_chart(fig_tree, use_container_width=True)
+
+    # Stacked bars for category and revenue
+    if tab_reg.open:
+        with tab_reg:
+            region_totals = rc_df.groupby("region", as_index=False, observed=True)["total_revenue"].sum()
+            region_order = region_totals.sort_values("total_revenue", ascending=False)["region"].tolist()
+
+            fig_stack = px.bar(rc_df, x="region", y="total_revenue", color="category",
+                               title="Which Regions Make the Most (and What’s Driving It)")
+            fig_stack.update_traces(hovertemplate="%{x}<br>%{fullData.name}: $%{y:,.0f}<extra></extra>")
+            fig_stack.update_layout(barmode="stack", template="plotly_white",
+                                    margin=dict(l=10, r=10, t=80, b=10),
+                                    title=dict(x=0.5, xanchor="center", yanchor="top", pad=dict(t=20)),
+                                    legend_title_text="Category")
+            fig_stack.update_xaxes(categoryorder="array", categoryarray=region_order)
+            fig_stack.update_yaxes(tickprefix="$", separatethousands=True, title_text="Revenue")
+            st.plotly_chart(fig_stack, use_container_width=True)
+
+            # Insight
+            top_region_row = region_totals.loc[region_totals["total_revenue"].idxmax()]
+            top_region, top_region_revenue = top_region_row["region"], top_region_row["total_revenue"]
+            top_cat_row = (rc_df[rc_df["region"] == top_region]
+                           .groupby("category", as_index=False, observed=True)["total_revenue"].sum()
+                           .sort_values("total_revenue", ascending=False).iloc[0])
+            st.info(
+                f"{top_region} leads with ${top_region_revenue:,.0f}. "
+                f"Within {top_region}, {top_cat_row['category']} contributes {top_cat_row['total_revenue']:,.0f}."
+            )
+
+category_region_section(page_data["top_category"], page_data["region_category"])
 
 st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -357,113 +728,159 @@ st.info(
     """
 )
 
-col1, col2 = st.columns([1, 2])
-
-all_store_df = run_query(load_sql("queries/all_stores_performance.txt"))
-with col1:
-    st.dataframe(all_store_df)
-    #orst.dataframe(all_store_df, use_container_width=True, height=all_store_df.shape[0]*35)
-
-with col2:
-    st.write("**Select which store you want to look at.**")
-    selected_store = st.selectbox("Choose a store", options=all_store_df["store_name"].tolist())
-
-    kpi_tab, products_tab = st.tabs(["KPI Trends", "Top Items"])
-
-    with kpi_tab:
-        kpi_store_df = run_query(load_sql("queries/store_kpi_summary.txt"), params=(selected_store,))
-        if not kpi_store_df.empty:
-            month_options = {f"Last {i} months": i for i in range(12, 1, -1)}
-            month_options["Last month"] = 1
-            month_options["All time"] = None
-            selected_label = st.selectbox("Select period", list(month_options.keys()))
-            months_back = month_options[selected_label]
-
-            plot_df = kpi_store_df if months_back is None else kpi_store_df.iloc[-months_back:]
-
-            total_rev = plot_df["total_revenue"].sum()
-            total_orders = plot_df["total_orders"].sum()
-            total_units = plot_df["units_sold"].sum()
-            aov_weighted = (total_rev / total_orders) if total_orders else 0.0
-
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("Revenue", f"${total_rev:,.0f}")
-            c2.metric("Orders", f"{int(total_orders):,}")
-            c3.metric("Units", f"{int(total_units):,}")
-            c4.metric("AOV", f"${aov_weighted:,.0f}")
-
-            metric_map = {
-                "Revenue": "total_revenue",
-                "Orders": "total_orders",
-                "Units Sold": "units_sold",
-                "Average Order Value": "average_order_value",
-            }
-            chosen_metric_label = st.selectbox("Trend metric", list(metric_map.keys()))
-            chosen_col = metric_map[chosen_metric_label]
-
-            fig = make_store_trend_fig(
-                df=kpi_store_df,
-                value_col=chosen_col,
-                months_back=months_back,
-                title=f"{chosen_metric_label} — {selected_store} ({selected_label})",
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No data for this store yet.")
-
-    with products_tab:
-        option_select = st.selectbox("Select a chart to view", options=["Top Categories", "Top Products"])
-        if option_select == "Top Categories":
-            cat_df = run_query(load_sql("queries/all_stores_category.txt"), params=(selected_store,))
-            if not cat_df.empty:
-                cat_df = cat_df.sort_values("revenue", ascending=True)
-                total_rev = cat_df["revenue"].sum()
-                cat_df["share"] = (cat_df["revenue"] / total_rev).fillna(0)
-                fig_cat = px.bar(
-                    cat_df, x="revenue", y="category", orientation="h",
-                    title=f"Top Categories by Revenue — {selected_store}",
-                    labels={"revenue": "Revenue", "category": "Category"},
-                    text=cat_df["share"].map(lambda x: f"{x*100:.0f}%"),
-                )
-                fig_cat.update_traces(
-                    hovertemplate="%{y}<br>Revenue: $%{x:,.0f}<br>Share: %{text}<extra></extra>",
-                    textposition="outside", cliponaxis=False,
-                )
-                fig_cat.update_layout(
-                    template="plotly_white", margin=dict(l=10, r=10, t=80, b=10),
-                    hovermode="y unified", xaxis_title="Revenue", yaxis_title="Category",
-                )
-                fig_cat.update_xaxes(tickprefix="$", separatethousands=True)
-                st.plotly_chart(fig_cat, use_container_width=True)
-
-                top_row = cat_df.sort_values("revenue", ascending=False).iloc[0]
-                st.caption(f"{top_row['category']} leads this store with "
-                           f"${top_row['revenue']:,.0f} ({top_row['share']*100:.0f}% of category revenue).")
-            else:
-                st.info("No category revenue found for this store.")
-
-        if option_select == "Top Products":
-            prod_df = run_query(load_sql("queries/all_stores_products.txt"), params=(selected_store,))
-            if not prod_df.empty:
-                prod_df = prod_df.sort_values("revenue", ascending=True)
-                fig_top = px.bar(
-                    prod_df, x="revenue", y="product_name", orientation="h",
-                    title=f"Top Products by Revenue — {selected_store}",
-                    labels={"revenue": "Revenue", "product_name": "Product"},
-                )
-                fig_top.update_layout(template="plotly_white",
-                                      margin=dict(l=10, r=10, t=80, b=10),
-                                      hovermode="y unified")
-                fig_top.update_xaxes(tickprefix="$", separatethousands=True)
-                st.plotly_chart(fig_top, use_container_width=True)
-
-                total_rev = prod_df["revenue"].sum()
-                top3 = prod_df.sort_values("revenue", ascending=False).head(3)
-                share = top3["revenue"].sum() / total_rev if total_rev else 0
-                st.caption(f"Top 3 products contribute {share*100:.0f}% of store revenue.")
-            else:
-                st.info("No product sales found for this store.")
+@st.fragment
+def store_section(all_stores_future: Future, store_index_future: Future):
+    col1, col2 = st.columns([1, 2])
+
+    all_store_df, _ = within_budget(all_stores_future)
+    if all_store_df is None:
+        st.info(PREVIEW_PENDING)
+        return
+    with col1:
+        st.dataframe(all_store_df)
+        #orst.dataframe(all_store_df, use_container_width=True, height=all_store_df.shape[0]*35)
+
+    with col2:
+        st.write("**Select which store you want to look at.**")
+        selected_store = st.selectbox("Choose a store", options=all_store_df["store_name"].tolist())
+        # served from the per-store index: no SQL round trip on a store switch
+        store_index, _ = within_budget(store_index_future)
+        if store_index is None:
+            st.info(PREVIEW_PENDING)
+            return
+        store_data = store_index.get(selected_store, store_index[None])
+
+        kpi_tab, products_tab, coverage_tab = st.tabs(["KPI Trends", "Top Items", "Stock Coverage"],
+                                                      key="store_tabs", on_change="rerun")
+
+        if kpi_tab.open:
+            with kpi_tab:
+                kpi_store_df = store_data["kpi"]
+                if not kpi_store_df.empty:
+                    month_options = {f"Last {i} months": i for i in range(12, 1, -1)}
+                    month_options["Last month"] = 1
+                    month_options["All time"] = None
+                    selected_label = st.selectbox("Select period", list(month_options.keys()))
+                    months_back = month_options[selected_label]
+
+                    plot_df = kpi_store_df if months_back is None else kpi_store_df.iloc[-months_back:]
+
+                    total_rev = plot_df["total_revenue"].sum()
+                    total_orders = plot_df["total_orders"].sum()
+                    total_units = plot_df["units_sold"].sum()
+                    aov_weighted = (total_rev / total_orders) if total_orders else 0.0
+
+                    c1, c2, c3, c4 = st.columns(4)
+                    c1.metric("Revenue", f"${total_rev:,.0f}")
+                    c2.metric("Orders", f"{int(total_orders):,}")
+                    c3.metric("Units", f"{int(total_units):,}")
+                    c4.metric("AOV", f"${aov_weighted:,.0f}")
+
+                    metric_map = {
+                        "Revenue": "total_revenue",
+                        "Orders": "total_orders",
+                        "Units Sold": "units_sold",
+                        "Average Order Value": "average_order_value",
+                    }
+                    chosen_metric_label = st.selectbox("Trend metric", list(metric_map.keys()))
+                    chosen_col = metric_map[chosen_metric_label]
+
+                    fig = cached_figure(
+                        make_store_trend_fig,
+                        kpi_store_df,
+                        value_col=chosen_col,
+                        months_back=months_back,
+                        title=f"{chosen_metric_label} — {selected_store} ({selected_label})",
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+                else:
+                    st.info("No data for this store yet.")
+
+        if products_tab.open:
+            with products_tab:
+                option_select = st.selectbox("Select a chart to view", options=["Top Categories", "Top Products"])
+                if option_select == "Top Categories":
+                    cat_df = store_data["category"]
+                    if not cat_df.empty:
+                        cat_df = cat_df.sort_values("revenue", ascending=True)
+                        total_rev = cat_df["revenue"].sum()
+                        cat_df["share"] = (cat_df["revenue"] / total_rev).fillna(0)
+                        fig_cat = px.bar(
+                            cat_df, x="revenue", y="category", orientation="h",
+                            title=f"Top Categories by Revenue — {selected_store}",
+                            labels={"revenue": "Revenue", "category": "Category"},
+                            text=cat_df["share"].map(lambda x: f"{x*100:.0f}%"),
+                        )
+                        fig_cat.update_traces(
+                            hovertemplate="%{y}<br>Revenue: $%{x:,.0f}<br>Share: %{text}<extra></extra>",
+                            textposition="outside", cliponaxis=False,
+                        )
+                        fig_cat.update_layout(
+                            template="plotly_white", margin=dict(l=10, r=10, t=80, b=10),
+                            hovermode="y unified", xaxis_title="Revenue", yaxis_title="Category",
+                        )
+                        fig_cat.update_xaxes(tickprefix="$", separatethousands=True)
+                        st.plotly_chart(fig_cat, use_container_width=True)
+
+                        top_row = cat_df.sort_values("revenue", ascending=False).iloc[0]
+                        st.caption(f"{top_row['category']} leads this store with "
+                                   f"${top_row['revenue']:,.0f} ({top_row['share']*100:.0f}% of category revenue).")
+                    else:
+                        st.info("No category revenue found for this store.")
+
+                if option_select == "Top Products":
+                    prod_df = store_data["products"]
+                    if not prod_df.empty:
+                        prod_df = prod_df.sort_values("revenue", ascending=True)
+                        fig_top = px.bar(
+                            prod_df, x="revenue", y="product_name", orientation="h",
+                            title=f"Top Products by Revenue — {selected_store}",
+                            labels={"revenue": "Revenue", "product_name": "Product"},
+                        )
+                        fig_top.update_layout(template="plotly_white",
+                                              margin=dict(l=10, r=10, t=80, b=10),
+                                              hovermode="y unified")
+                        fig_top.update_xaxes(tickprefix="$", separatethousands=True)
+                        st.plotly_chart(fig_top, use_container_width=True)
+
+                        total_rev = prod_df["revenue"].sum()
+                        top3 = prod_df.sort_values("revenue", ascending=False).head(3)
+                        share = top3["revenue"].sum() / total_rev if total_rev else 0
+                        st.caption(f"Top 3 products contribute {share*100:.0f}% of store revenue.")
+                    else:
+                        st.info("No product sales found for this store.")
+
+        if coverage_tab.open:
+            with coverage_tab:
+                # this store's stock against this store's demand, lowest coverage first
+                cov_df = store_data.get("coverage")
+                if cov_df is not None and not cov_df.empty:
+                    store_cov_threshold = st.number_input("Critical coverage (months)", min_value=0.0, value=1.0,
+                                                          step=0.5, key="store_cov_threshold")
+                    low = cov_df["stock_coverage"].le(store_cov_threshold)
+                    st.metric("SKUs at or below threshold", f"{int(low.sum()):,} of {len(cov_df):,}")
+                    st.dataframe(
+                        cov_df.rename(columns={
+                            "product_name": "Product",
+                            "category": "Category",
+                            "stock": "Stock",
+                            "avg_monthly_sales": "Avg Monthly Sales",
+                            "recent_monthly_sales": f"Last {ingest.DEMAND_RECENT_MONTHS} Months (avg)",
+                            "stock_coverage": "Stock Coverage (months)",
+                        }),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "Stock": st.column_config.NumberColumn(format="%.0f"),
+                            "Stock Coverage (months)": st.column_config.NumberColumn(format="%.2f"),
+                        },
+                    )
+                    st.caption("Coverage = stock at this store ÷ this store's average monthly unit sales; "
+                               "products without sales here have no coverage.")
+                else:
+                    st.info("No inventory found for this store.")
 
+store_section(page_data["all_stores"], page_data["store_index"])
 
 st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -483,174 +900,161 @@ st.info(
 
 #Low stock risk table section
 st.subheader("Low Stock Risk")
-low_stock_df = run_query(load_sql("queries/inventory_tab_low_stock_risk.txt"))
-if low_stock_df.empty:
-        st.info("No inventory data available.")
-c1, c2, c3 = st.columns([1, 1, 1])
-with c1:
-    # Percentile to flag "at-risk" (default bottom 15%)
-    pct = st.slider("Risk cutoff (bottom % by category)", min_value=5, max_value=50, value=15, step=5)
-with c2:
-    # (optional)
-    categories = sorted(low_stock_df["category"].dropna().unique().tolist())
-    pick_cats = st.multiselect("Filter categories", categories, default=categories)
-with c3:
-    # Coverage threshold (months)
-    cov_threshold = st.number_input("Critical coverage (months)", min_value=0.0, value=1.0, step=0.5)
-
-# Filter by category selection
-d = low_stock_df[low_stock_df["category"].isin(pick_cats)].copy()
-d["risk_percentile"] = (d.groupby("category")["avg_stock"].rank(method="min", pct=True))
-
-# Flag low coverage (<= threshold) OR bottom X% by stock within category
-cutoff = pct / 100.0
-
-flag_percentile = d["risk_percentile"] <= cutoff
-flag_coverage = d["stock_coverage"].fillna(0) <= cov_threshold
-
-# Risk reason column
-d["Risk Reason"] = None
-d.loc[flag_percentile & ~flag_coverage, "Risk Reason"] = "Percentile"
-d.loc[~flag_percentile & flag_coverage, "Risk Reason"] = "Coverage"
-d.loc[flag_percentile & flag_coverage, "Risk Reason"] = "Both"
-
-# Keep only risky SKUs
-at_risk = d[flag_percentile | flag_coverage].copy()
-
-at_risk = at_risk.sort_values(["category", "risk_percentile", "stock_coverage"]).reset_index(drop=True)
-view = at_risk.rename(columns={
-"product_name": "Product",
-"category": "Category",
-"avg_stock": "Avg Stock",
-"avg_monthly_sales": "Avg Monthly Sales",
-"stock_coverage": "Stock Coverage (months)",
-"risk_percentile": "Risk Percentile",
-})
-
-# Cap the percentile to [0,1] in case of outliers
-view["Risk Percentile"] = view["Risk Percentile"].clip(0, 1)
-
-# KPI: % of SKUs at risk
-total_skus = len(d)
-at_risk_count = len(view)
-at_risk_pct = (at_risk_count / total_skus * 100) if total_skus else 0
-
-k1, k2, k3 = st.columns(3)
-k1.metric("SKUs at risk", f"{at_risk_count:,}")
-k2.metric("Share of SKUs", f"{at_risk_pct:.0f}%")
-k3.metric("Coverage threshold", f"{cov_threshold:.1f} mo")
-
-st.dataframe(
-        view,
+@st.fragment
+def low_stock_section(low_stock_future: Future):
+    risk_index, _ = within_budget(low_stock_future)
+    if risk_index is None:
+        st.info(PREVIEW_PENDING)
+        return
+    if not len(risk_index):
+            st.info("No inventory data available.")
+    c1, c2, c3 = st.columns([1, 1, 1])
+    with c1:
+        # Percentile to flag "at-risk" (default bottom 15%)
+        pct = st.slider("Risk cutoff (bottom % by category)", min_value=5, max_value=50, value=15, step=5)
+    with c2:
+        # (optional)
+        categories = risk_index.categories
+        pick_cats = st.multiselect("Filter categories", categories, default=categories)
+    with c3:
+        # Coverage threshold (months)
+        cov_threshold = st.number_input("Critical coverage (months)", min_value=0.0, value=1.0, step=0.5)
+
+    # Flag low coverage (<= threshold) OR bottom X% by stock within the selected categories
+    risk = risk_index.query(pct, cov_threshold, categories=pick_cats)
+    view = risk["at_risk"].rename(columns={
+    "product_name": "Product",
+    "category": "Category",
+    "avg_stock": "Avg Stock",
+    "avg_monthly_sales": "Avg Monthly Sales",
+    "stock_coverage": "Stock Coverage (months)",
+    "risk_percentile": "Risk Percentile",
+    })
+
+    # Cap the percentile to [0,1] in case of outliers
+    view["Risk Percentile"] = view["Risk Percentile"].clip(0, 1)
+
+    # KPI: % of SKUs at risk
+    total_skus = risk["total_skus"]
+    at_risk_count = len(view)
+    at_risk_pct = (at_risk_count / total_skus * 100) if total_skus else 0
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("SKUs at risk", f"{at_risk_count:,}")
+    k2.metric("Share of SKUs", f"{at_risk_pct:.0f}%")
+    k3.metric("Coverage threshold", f"{cov_threshold:.1f} mo")
+
+    st.dataframe(
+            view,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Avg Stock": st.column_config.NumberColumn(format="%.0f"),
+                "Avg Monthly Sales": st.column_config.NumberColumn(format="%.1f"),
+                "Stock Coverage (months)": st.column_config.NumberColumn(format="%.2f"),
+                "Risk Percentile": st.column_config.ProgressColumn(
+                    "Risk Percentile (by category)",
+                    help="Lower percentile = lower stock vs peers (more risky).",
+                    min_value=0.0, max_value=1.0
+                ),
+            },
+        )
+
+    # Download current filtered table
+    csv = view.to_csv(index=False).encode("utf-8")
+    st.download_button(
+        "⬇️ Download risk table (CSV)",
+        data=csv,
+        file_name="low_stock_risk.csv",
+        mime="text/csv",
         use_container_width=True,
-        hide_index=True,
-        column_config={
-            "Avg Stock": st.column_config.NumberColumn(format="%.0f"),
-            "Avg Monthly Sales": st.column_config.NumberColumn(format="%.1f"),
-            "Stock Coverage (months)": st.column_config.NumberColumn(format="%.2f"),
-            "Risk Percentile": st.column_config.ProgressColumn(
-                "Risk Percentile (by category)",
-                help="Lower percentile = lower stock vs peers (more risky).",
-                min_value=0.0, max_value=1.0
-            ),
-        },
     )
 
-# Download current filtered table
-csv = view.to_csv(index=False).encode("utf-8")
-st.download_button(
-    "⬇️ Download risk table (CSV)",
-    data=csv,
-    file_name="low_stock_risk.csv",
-    mime="text/csv",
-    use_container_width=True,
-)
-
-# Find which category concentrates most of the risk (by count)
-if not view.empty:
-    top_cat = (
-        view.groupby("Category").size().sort_values(ascending=False).index[0])
-    st.info(
-        f"{at_risk_pct:.0f}% of SKUs are below critical stock levels "
-        f"(≤ {cov_threshold:.1f} months coverage or bottom {pct}% by stock), "
-        f"with most risk concentrated in “{top_cat}”."
-    )
-else:
-    st.info(
-        f"No SKUs currently flagged at ≤ {cov_threshold:.1f} months coverage "
-        f"or bottom {pct}% by stock in the selected categories."
-    )
+    # Find which category concentrates most of the risk (by count)
+    if not view.empty:
+        top_cat = (
+            view.groupby("Category", observed=True).size().sort_values(ascending=False).index[0])
+        st.info(
+            f"{at_risk_pct:.0f}% of SKUs are below critical stock levels "
+            f"(≤ {cov_threshold:.1f} months coverage or bottom {pct}% by stock), "
+            f"with most risk concentrated in “{top_cat}”."
+        )
+    else:
+        st.info(
+            f"No SKUs currently flagged at ≤ {cov_threshold:.1f} months coverage "
+            f"or bottom {pct}% by stock in the selected categories."
+        )
 
+low_stock_section(page_data["low_stock"])
 
 #Category stock levels section
 st.subheader("Category Stock Levels")
-cat_levels_df = run_query(load_sql("queries/inventory_category_stock_levels.txt"))
-
-if cat_levels_df.empty:
-    st.info("No inventory/sales data to plot.")
-else:
-    # Coverage = months of stock on hand
-    cat_levels_df = cat_levels_df.copy()
-    cat_levels_df["coverage"] = (
-        cat_levels_df["avg_stock"] / cat_levels_df["avg_monthly_sales"].replace(0, pd.NA)
-    ).fillna(pd.NA)
-
-    # Controls
-    c1, c2 = st.columns([1, 1])
-    with c1:
-        cov_threshold = st.number_input("Critical coverage threshold (months)", min_value=0.0, value=1.0, step=0.5)
-    with c2:
-        show_top = st.slider("Show top N categories by coverage", 3, len(cat_levels_df), len(cat_levels_df))
-
-    # Sort & slice
-    plot_cov = cat_levels_df.sort_values("coverage", ascending=False).head(show_top)
-
-    # Risk band label (for color)
-    def band(v, thr):
-        if pd.isna(v): return "No sales data"
-        if v < thr:    return f"< {thr} mo (risk)"
-        return f"≥ {thr} mo"
-
-    plot_cov["risk_band"] = plot_cov["coverage"].apply(lambda v: band(v, cov_threshold))
-
-    # Bar chart
-    fig_cov = px.bar(
-        plot_cov,
-        x="category",
-        y="coverage",
-        color="risk_band",
-        text=plot_cov["coverage"].map(lambda x: f"{x:.1f}" if pd.notna(x) else "—"),
-        title="Stock Coverage by Category (months)",
-        labels={"category": "Category", "coverage": "Coverage (months)", "risk_band": "Status"},
-    )
-    fig_cov.update_traces(textposition="outside", cliponaxis=False)
-    fig_cov.update_layout(
-        template="plotly_white",
-        margin=dict(l=10, r=10, t=80, b=10),
-        hovermode="x",
-    )
-    # Reference line at threshold
-    fig_cov.add_hline(y=cov_threshold, line_dash="dot", annotation_text=f"Threshold = {cov_threshold:.1f} mo")
-
-    st.plotly_chart(fig_cov, use_container_width=True)
-
-    # Quick insight
-    below = plot_cov["coverage"].dropna().lt(cov_threshold).mean() * 100 if not plot_cov.empty else 0
-    st.caption(f"{below:.0f}% of shown categories are below the {cov_threshold:.1f}-month coverage threshold.")
+@st.fragment
+def stock_levels_section(stock_levels_future: Future):
+    cat_levels_df, _ = within_budget(stock_levels_future)
+
+    if cat_levels_df is None:
+        st.info(PREVIEW_PENDING)
+    elif cat_levels_df.empty:
+        st.info("No inventory/sales data to plot.")
+    else:
+        # Coverage = months of stock on hand
+        cat_levels_df = analytics.stock_coverage(cat_levels_df)
 
-    # Optional: download current view
-    dl = plot_cov[["category", "avg_stock", "avg_monthly_sales", "coverage", "sku_count", "risk_band"]]
-    st.download_button(
-        "⬇️ Download coverage table (CSV)",
-        data=dl.to_csv(index=False).encode("utf-8"),
-        file_name="category_coverage.csv",
-        mime="text/csv",
-        use_container_width=True,
-    )
+        # Controls
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            cov_threshold = st.number_input("Critical coverage threshold (months)", min_value=0.0, value=1.0, step=0.5)
+        with c2:
+            show_top = st.slider("Show top N categories by coverage", 3, len(cat_levels_df), len(cat_levels_df))
+
+        # Sort & slice
+        plot_cov = cat_levels_df.sort_values("coverage", ascending=False).head(show_top)
+
+        # Risk band label (for color)
+        def band(v, thr):
+            if pd.isna(v): return "No sales data"
+            if v < thr:    return f"< {thr} mo (risk)"
+            return f"≥ {thr} mo"
+
+        plot_cov["risk_band"] = plot_cov["coverage"].apply(lambda v: band(v, cov_threshold))
+
+        # Bar chart
+        fig_cov = px.bar(
+            plot_cov,
+            x="category",
+            y="coverage",
+            color="risk_band",
+            text=plot_cov["coverage"].map(lambda x: f"{x:.1f}" if pd.notna(x) else "—"),
+            title="Stock Coverage by Category (months)",
+            labels={"category": "Category", "coverage": "Coverage (months)", "risk_band": "Status"},
+        )
+        fig_cov.update_traces(textposition="outside", cliponaxis=False)
+        fig_cov.update_layout(
+            template="plotly_white",
+            margin=dict(l=10, r=10, t=80, b=10),
+            hovermode="x",
+        )
+        # Reference line at threshold
+        fig_cov.add_hline(y=cov_threshold, line_dash="dot", annotation_text=f"Threshold = {cov_threshold:.1f} mo")
 
+        st.plotly_chart(fig_cov, use_container_width=True)
 
+        # Quick insight
+        below = plot_cov["coverage"].dropna().lt(cov_threshold).mean() * 100 if not plot_cov.empty else 0
+        st.caption(f"{below:.0f}% of shown categories are below the {cov_threshold:.1f}-month coverage threshold.")
 
+        # Optional: download current view
+        dl = plot_cov[["category", "avg_stock", "avg_monthly_sales", "coverage", "sku_count", "risk_band"]]
+        st.download_button(
+            "⬇️ Download coverage table (CSV)",
+            data=dl.to_csv(index=False).encode("utf-8"),
+            file_name="category_coverage.csv",
+            mime="text/csv",
+            use_container_width=True,
+        )
 
+stock_levels_section(page_data["stock_levels"])
 
 #Customers Tab
 st.header("Customers Analysis")
@@ -670,111 +1074,44 @@ st.info(
     """
 )
 
-cust_tab, = st.tabs(["Retention & Behavior"])
-with cust_tab:
-    customer_df = run_query(load_sql("queries/customer_order_data.txt"))
-    if customer_df.empty:
-        st.info("No customer transactions available.")
+def query_top_customers(source, categories: list, top_n: int) -> pd.DataFrame:
+    """
+    Top customers over the selected categories and the page's date range, from the
+    star schema, a precomputed customer x category revenue frame, or the engine's
+    top-K query (anything else).
+    """
+    if isinstance(source, star.StarSchema):
+        return source.top_customers(categories, top_n, date_window)
+    if "customer_name" in source:
+        return analytics.top_customers(source, categories, top_n)
+    sql, params = window_sql("customer_top_k", date_window)
+    return analytics.top_customer_rows(run_query(sql, (params or ()) + (json.dumps(categories),) * 2 + (top_n,)))
+
+@st.fragment
+def top_customers_section(revenue_future: Future):
+    #Individual customer revenue
+    source, _ = within_budget(revenue_future)
+    if source is None:
+        st.info(PREVIEW_PENDING)
+        return
+    if isinstance(source, star.StarSchema):
+        sel_categories = source.categories
     else:
-        
-        #Cohort Retention Logic starts here
-        tx = customer_df.copy()
-        tx["order_month"] = pd.to_datetime(tx["order_month"])
-        #Get the first month of each customer's orders
-        first_month = tx.groupby("customer_id")["order_month"].min().rename("cohort_month")
-        #Merge back so every customer has a known first month
-        tx = tx.merge(first_month, on="customer_id", how="left")
-        def month_diff(a, b):
-            return (a.year - b.year) * 12 + (a.month - b.month)
-        #Get how many month since the first purchase that a transaction happened.
-        tx["period_number"] = tx.apply(lambda r: month_diff(r["order_month"], r["cohort_month"]), axis=1)
-
-        #Checks each cohort's first size(number of customers) at the time the period number is 0
-        cohort_sizes = (
-        tx[tx["period_number"] == 0]
-        .groupby("cohort_month")["customer_id"].nunique()
-        .rename("cohort_size")
-        )   
-
-        #Checks how many customers were active in each cohort at each period number
-        cohort_pivot = (tx.groupby(["cohort_month", "period_number"])["customer_id"].nunique().reset_index().pivot(index="cohort_month", columns="period_number", values="customer_id").fillna(0))
-
-        #Gets the % of customers still active.
-        cohort_retention = (cohort_pivot.T / cohort_sizes).T.fillna(0)
-        
-        #Cohort Retention Logic ends here
-
-        #Repeat Purchase Rate logic starts here
-        cust_order_counts = tx.groupby("customer_id")["order_month"].nunique().rename("order_months_count")
-        total_customers = cust_order_counts.shape[0]
-        repeat_customers = int((cust_order_counts >= 2).sum())
-        repeat_rate = (repeat_customers / total_customers * 100) if total_customers else 0
-   
-        #Repeat Purchase Rate logic ends here
-
-        
-        #Customer segmentation logic starts here
-        
-        #To separate each customer based on the amount of orders.
-        def seg(n):
-            if n == 1: return "New (1 order month)"
-            if 2 <= n <= 4: return "Repeat (2–4 order months)"
-            return "Loyal (5+ order months)"
-
-        cust_orders = tx.groupby("customer_id").agg(orders=("order_month", "nunique"),revenue=("revenue", "sum")).reset_index()
-        cust_orders["segment"] = cust_orders["orders"].apply(seg)
-
-        seg_table = (
-            cust_orders.groupby("segment", as_index=False)
-                    .agg(Customers=("customer_id", "nunique"),
-                            Revenue=("revenue", "sum"),
-                            Avg_Orders=("orders", "mean"))
-        )
-
-        seg_table = seg_table.sort_values("Revenue", ascending=False)
-        total_rev_all = seg_table["Revenue"].sum()
-        if total_rev_all:
-            seg_table["Revenue Share"] = seg_table["Revenue"] / total_rev_all
-
-        #Customer segmentation logic ends here
-
-        
-        #Metrics for customers
-        k1, k2, k3 = st.columns(3)
-        k1.metric("Repeat Purchase Rate", f"{repeat_rate:.0f}%")
-        k2.metric("Customers (≥2 order months)", f"{repeat_customers:,}")
-        k3.metric("Total Customers", f"{total_customers:,}")
-
+        sel_categories = sorted(source["category"].dropna().unique().tolist())
+    c1, c2 = st.columns([1, 1])
+    with c1:
+        top_n = st.slider("Top customers", min_value=3, max_value=20, value=5, step=1)
+    with c2:
+        sort_order = st.multiselect("Filter categories", sel_categories, key="customer_categories")
 
-        #Individual customer revenue
-        
-        customer_revenue_df = run_query(load_sql("queries/customer_revenue.txt"))
-        c1, c2 = st.columns([1, 1])
-        with c1:
-            top_n = st.slider("Top customers", min_value=3, max_value=20, value=5, step=1)
-        with c2:
-            sel_categories = sorted(customer_revenue_df["category"].dropna().unique().tolist())
-            sort_order = st.multiselect("Filter categories", categories)
+    if not sel_categories:
+        st.info("No customer/category revenue data available.")
+    else:
+        top_customers = query_top_customers(source, sort_order, top_n)
 
-        if customer_revenue_df.empty:
-            st.info("No customer/category revenue data available.")
+        if top_customers.empty:
+            st.info("No rows match the selected categories.")
         else:
-            df = customer_revenue_df.copy()
-            if sort_order:
-                df = df[df["category"].isin(sort_order)]
-
-            if df.empty:
-                st.info("No rows match the selected categories.")
-            else:
-                agg = (
-                    df.groupby("customer_name")
-                    .agg(
-                        total_revenue=("total_revenue", "sum"),
-                        categories=("category", lambda x: ", ".join(sorted(set(x))))
-                    )
-                    .reset_index()
-                )
-            top_customers = agg.sort_values("total_revenue", ascending=False).head(top_n)
 
             tcol, ccol = st.columns([1, 1], gap="large")
 
@@ -829,75 +1166,79 @@ with cust_tab:
                 fig.update_xaxes(tickprefix="$", separatethousands=True)
                 st.plotly_chart(fig, use_container_width=True)
 
-
-
-        
-
-
-        def make_checkpoint_bars(cohort_retention: pd.DataFrame, checkpoints=(1,2,3), title="Checkpoint Retention by Cohort"):
-            bars = (cohort_retention.copy() * 100)
-            bars = bars[[c for c in bars.columns if c in checkpoints]]
-            bars_long = (
-                bars.reset_index()
-                    .melt(id_vars="cohort_month", var_name="Months since first purchase", value_name="Retention %")
-                    .dropna()
-            )
-            fig = px.bar(
-                bars_long,
-                x="cohort_month",
-                y="Retention %",
-                color="Months since first purchase",
-                barmode="group",
-                title=title,
-                labels={"cohort_month": "Cohort (first purchase month)"},
-                text=bars_long["Retention %"].round(0).astype(int).astype(str) + "%"
-            )
-            fig.update_traces(textposition="outside", cliponaxis=False)
-            fig.update_xaxes(
-                tickmode="array",
-                tickvals=bars_long["cohort_month"].unique(), 
-                tickangle=-45                            
+@st.fragment
+def customer_section(metrics_future: Future, revenue_future: Future):
+    cust_tab, = st.tabs(["Retention & Behavior"])
+    with cust_tab:
+        # Cohort retention, repeat rate and segments (vectorized, cached per query result)
+        cust_metrics, is_preview = within_budget(metrics_future, lambda: preview_customer_metrics(date_window))
+        if not cust_metrics["total_customers"]:
+            st.info("No customer transactions available.")
+        else:
+            cohort_retention = cust_metrics["cohort_retention"]
+            total_customers = cust_metrics["total_customers"]
+            repeat_customers = cust_metrics["repeat_customers"]
+            repeat_rate = cust_metrics["repeat_rate"]
+            seg_table = cust_metrics["seg_table"]
+
+
+            #Metrics for customers
+            k1, k2, k3 = st.columns(3)
+            approx = "≈" if is_preview else ""
+            k1.metric("Repeat Purchase Rate", f"{approx}{repeat_rate:.0f}%")
+            k2.metric("Customers (≥2 order months)", f"{approx}{repeat_customers:,}")
+            k3.metric("Total Customers", f"{approx}{total_customers:,}")
+            if is_preview:
+                st.caption(f"⚡ Preview from a stratified sample of {cust_metrics['sample_customers']:,} customers: "
+                           f"repeat rate ±{cust_metrics['repeat_rate_error']:.1f} pts, total customers "
+                           f"±{cust_metrics['total_customers_error']:,.0f} (HyperLogLog), 95% bounds.")
+
+
+            #Individual customer revenue
+            top_customers_section(revenue_future)
+
+            st.subheader("Checkpoint Retention By Cohort")
+            fig_chk = cached_figure(make_checkpoint_bars, cohort_retention, checkpoints=(1,2,3,4))
+            st.plotly_chart(fig_chk, use_container_width=True)
+
+
+
+
+            #Customer segmentation table
+            st.subheader("Top Customer Segments by Revenue")
+            st.dataframe(
+                seg_table.assign(
+                    Revenue=lambda d: d["Revenue"].round(2),
+                    Avg_Orders=lambda d: d["Avg_Orders"].round(2),
+                    **({"Revenue Share": (seg_table["Revenue Share"]*100).round(0).astype("Int64").astype(str) + "%"}
+                    if "Revenue Share" in seg_table else {})
+                ),
+                use_container_width=True,
+                hide_index=True
             )
-            fig.update_layout(template="plotly_white", margin=dict(l=10, r=10, t=80, b=10))
-            return fig
-        
-        st.subheader("Checkpoint Retention By Cohort")
-        fig_chk = make_checkpoint_bars(cohort_retention, checkpoints=(1,2,3,4))
-        st.plotly_chart(fig_chk, use_container_width=True)
-
-        
-
-
-        #Customer segmentation table
-        st.subheader("Top Customer Segments by Revenue")
-        st.dataframe(
-            seg_table.assign(
-                Revenue=lambda d: d["Revenue"].round(2),
-                Avg_Orders=lambda d: d["Avg_Orders"].round(2),
-                **({"Revenue Share": (seg_table["Revenue Share"]*100).round(0).astype("Int64").astype(str) + "%"}
-                if "Revenue Share" in seg_table else {})
-            ),
+
+            #CSV download for further analysis
+            st.download_button(
+            "⬇️ Download segments (CSV)",
+            data=seg_table.to_csv(index=False).encode("utf-8"),
+            file_name="customer_segments.csv",
+            mime="text/csv",
             use_container_width=True,
-            hide_index=True
-        )
+            )
 
-        #CSV download for further analysis
-        st.download_button(
-        "⬇️ Download segments (CSV)",
-        data=seg_table.to_csv(index=False).encode("utf-8"),
-        file_name="customer_segments.csv",
-        mime="text/csv",
-        use_container_width=True,
-        )
+            month2_avg = (cohort_retention[2].mean() * 100) if 2 in cohort_retention.columns else None
+            insight = ""
+            if month2_avg is not None:
+                insight = f"Retention averages ~{month2_avg:.0f}% by the 2nd month; targeted promotions could improve repeat orders."
+            else:
+                insight = "Retention drops after the early months; targeted promotions could improve repeat orders."
+            st.info(insight)
 
-        month2_avg = (cohort_retention[2].mean() * 100) if 2 in cohort_retention.columns else None
-        insight = ""
-        if month2_avg is not None:
-            insight = f"Retention averages ~{month2_avg:.0f}% by the 2nd month; targeted promotions could improve repeat orders."
-        else:
-            insight = "Retention drops after the early months; targeted promotions could improve repeat orders."
-        st.info(insight)
+customer_section(page_data["customer_metrics"], page_data["customer_revenue"])
 
+if pending_exact:
+    with preview_status:
+        exact_results_poller(pending_exact)
 
 st.header("About")
 st.info(
@@ -1044,7 +1385,7 @@ with tab_metrics:
         - **Metric**: `total_revenue = Σ(quantity × price)` aggregated per `customer_name` (optionally filtered by category).
     """)
     with st.expander("🔍 SQL query: Top customers by revenue"):
-        st.code(load_sql("queries/customer_revenue.txt"), language="sql")
+        st.code(load_sql("queries/customer_top_k.txt"), language="sql")
 
     st.markdown("""
     - **Cohort retention checkpoints**
@@ -1097,9 +1438,63 @@ with tab_dict:
         - `queries/all_stores_products.txt` – Store-level products by revenue  
         - `queries/inventory_tab_low_stock_risk.txt` – Low-stock risk inputs  
         - `queries/inventory_category_stock_levels.txt` – Category stock for monthly coverage analysis      
-        - `queries/customer_order_data.txt` – Customer transactions for cohorts/segments  
+        - `queries/store_index_coverage.txt` – Stock coverage per store × product, from the store's own demand  
+        - `queries/customer_order_data.txt` – Customer × month revenue for cohorts/segments  
         - `queries/customer_revenue.txt` – Customer × category revenue
+        - `queries/customer_top_k.txt` – Top customers for the selected categories, ranked and limited in SQL
+        - `queries/sales_months.txt` – Months with sales, the options of the date range (applied to every query)
+        - `queries/preview/customer_order_data.txt` – Fast preview: customer × month revenue over the stratified `sales_sample`
+        - `queries/preview/sales_sketch.txt` – Fast preview: each month's exact sale count and HyperLogLog sketch of its customers
         """
     )
 
-    
+
+# Hidden performance panel (?perf=1)
+if st.query_params.get("perf") == "1":
+    st.header("Performance")
+    query_log = get_query_log()
+    st.caption("Wall time of every run_query call and database build in this process, "
+               f"last {query_log.max_records:,} records; cache hits included.")
+    st.dataframe(
+        query_log.summary(),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "hit_rate": st.column_config.ProgressColumn("Cache hit rate", min_value=0.0, max_value=1.0),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+            "max_ms": st.column_config.NumberColumn("max (ms)", format="%.1f"),
+            "saved_bytes": st.column_config.NumberColumn("Saved by compact frames (bytes)"),
+        },
+    )
+    with st.expander("Recent records"):
+        st.dataframe(query_log.records().iloc[::-1].head(200), use_container_width=True, hide_index=True)
+
+# Connection pool & cache metrics
+with st.sidebar.expander(f"Connection pool ({get_engine().name} engine)"):
+    pool_stats = get_pool().stats()
+    p1, p2 = st.columns(2)
+    p1.metric("Pool size", f"{pool_stats['open']}/{pool_stats['size']}")
+    p2.metric("In use", pool_stats["in_use"])
+    p1.metric("Avg wait", f"{pool_stats['avg_wait_ms']:.1f} ms")
+    p2.metric("Max wait", f"{pool_stats['max_wait_ms']:.1f} ms")
+    st.caption(f"{pool_stats['checkouts']:,} checkouts, {pool_stats['waits']:,} had to wait, "
+               f"{pool_stats['timeouts']:,} timed out.")
+with st.sidebar.expander("Result cache"):
+    res_stats = get_result_cache().stats()
+    r1, r2 = st.columns(2)
+    r1.metric("Hits", f"{res_stats['hits']:,}")
+    r2.metric("Misses", f"{res_stats['misses']:,}")
+    st.caption(f"{res_stats['entries']}/{res_stats['max_entries']} results, "
+               f"{res_stats['bytes'] / 1024 ** 2:,.1f} MB; {res_stats['invalidated']:,} dropped after table changes.")
+    if get_disk_cache() is not None:
+        disk_stats = get_disk_cache().stats()
+        st.caption(f"Disk: {disk_stats['hits']:,} hits, {disk_stats['misses']:,} misses, "
+                   f"{disk_stats['bytes'] / 1024 ** 2:,.1f}/{disk_stats['max_bytes'] / 1024 ** 2:,.0f} MB, "
+                   f"{disk_stats['evicted']:,} evicted.")
+with st.sidebar.expander("Figure cache"):
+    fig_stats = get_figure_cache().stats()
+    f1, f2 = st.columns(2)
+    f1.metric("Hits", f"{fig_stats['hits']:,}")
+    f2.metric("Misses", f"{fig_stats['misses']:,}")
+    st.caption(f"{fig_stats['entries']}/{fig_stats['max_entries']} figures cached.")
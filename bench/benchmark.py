@@ -0,0 +1,246 @@
+"""
+Time ingest, every query in queries/ and the pandas post-processing steps on
+generated data, write the timings as JSON and compare them with a baseline.
+
+    python bench/benchmark.py --scale 1M --out bench/results/1M.json
+    python bench/benchmark.py --scale 1M --baseline bench/results/1M.json --threshold 0.25
+
+The CSVs are generated into bench/data/<scale> on first use. Each run ingests
+into a fresh database. Queries and pandas steps are timed --repeat times and
+the median is reported. The preview estimates are also checked against the
+exact monthly KPIs. The exit status is 1 when a step is slower than its
+baseline by more than --threshold (and by at least MIN_DELTA_SECONDS), or when
+a preview KPI's 95% band covers the exact value in fewer than --min-coverage
+of the months.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analytics  # noqa: E402
+import db  # noqa: E402
+import ingest  # noqa: E402
+from generate_data import SCALES, generate  # noqa: E402
+
+QUERY_DIR = os.path.join(ROOT, "queries")
+DIALECT_DIRS = {"duckdb"}
+
+# Parameters of queries that aren't per-store drill-downs
+QUERY_PARAMS = {"customer_top_k": ("[]", "[]", 5)}
+
+# Differences below this are timer noise, whatever the ratio
+MIN_DELTA_SECONDS = 0.05
+
+# Preview KPIs checked against main_kpi_summary, and the share of months whose
+# 95% band must cover the exact value (the last quarter has only three months)
+PREVIEW_KPIS = ("total_revenue", "units_sold", "average_order_value")
+MIN_PREVIEW_COVERAGE = 0.66
+
+
+def _timed(fn, repeat: int):
+    """(median seconds, last result) over `repeat` calls."""
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def query_files(dialect: str | None) -> dict:
+    """{relative path: SQL} for every query file, using the engine's dialect override when there is one."""
+    files = {}
+    for root, dirs, names in os.walk(QUERY_DIR):
+        dirs[:] = [d for d in dirs if d not in DIALECT_DIRS]
+        for name in names:
+            if not name.endswith(".txt"):
+                continue
+            rel = os.path.relpath(os.path.join(root, name), QUERY_DIR).replace(os.sep, "/")
+            override = os.path.join(QUERY_DIR, dialect, rel) if dialect else None
+            with open(override if override and os.path.exists(override) else os.path.join(root, name),
+                      "r", encoding="utf-8") as f:
+                files[rel] = f.read()
+    return dict(sorted(files.items()))
+
+
+def run(csv_dir: str, engine_name: str = "sqlite", repeat: int = 3, workers: int = ingest.PARSE_WORKERS,
+        compact: bool = True, columnar: bool = db.adbc_sqlite is not None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        db_path = os.path.join(work, "bench.db")
+        conn = db.open_writer(db_path)
+
+        # Ingest: per-table sync (tables load while the next shards parse), rollup, preview tables, columnar export
+        started = time.perf_counter()
+        for table, r in ingest.sync_database(conn, csv_dir, workers=workers).items():
+            results[f"ingest/{table}"] = {"seconds": r["seconds"], "rows": r["rows"], "rows_per_sec": r["rows_per_sec"]}
+        results["ingest/sync"] = {"seconds": time.perf_counter() - started}
+        started = time.perf_counter()
+        ingest.build_rollup(conn, {t: {"action": "full"} for t in ingest.TABLES})
+        results["ingest/rollup"] = {"seconds": time.perf_counter() - started}
+        started = time.perf_counter()
+        ingest.build_preview(conn, {t: {"action": "full"} for t in ingest.TABLES})
+        results["ingest/preview"] = {"seconds": time.perf_counter() - started}
+        if engine_name == "duckdb":
+            started = time.perf_counter()
+            ingest.export_parquet(conn, os.path.join(work, "columnar"), {t: {"action": "full"} for t in ingest.TABLES},
+                                  "full", "full")
+            results["ingest/parquet_export"] = {"seconds": time.perf_counter() - started}
+            engine = db.DuckDBEngine(os.path.join(work, "columnar"), compact=compact)
+        else:
+            engine = db.SQLiteEngine(db.ConnectionPool(db_path, columnar=columnar), compact=compact)
+
+        # Queries: parameterised ones (per-store drill-downs) get the busiest store
+        store = engine.query(
+            "SELECT st.store_name FROM stores st JOIN sales_monthly m ON m.store_id = st.store_id "
+            "GROUP BY st.store_id, st.store_name ORDER BY SUM(m.orders) DESC LIMIT 1").iloc[0, 0]
+        # ...and each runs again over the last quarter of data (the dashboard's date range)
+        months = engine.query("SELECT month FROM sales_monthly WHERE month IS NOT NULL GROUP BY month ORDER BY month")
+        quarter = (str(months["month"].iloc[max(len(months) - 3, 0)]), str(months["month"].iloc[-1]))
+        frames, quarter_frames = {}, {}
+        for rel, sql in query_files(engine.dialect).items():
+            params = QUERY_PARAMS.get(rel[:-4]) or (store,) * sql.count("?") or None
+            seconds, df = _timed(lambda: engine.query(sql, params), repeat)
+            results[f"query/{rel[:-4]}"] = {"seconds": seconds, "rows": len(df)}
+            frames[rel[:-4]] = df
+            windowed, window_params = ingest.restrict_months(sql, quarter)
+            if window_params:
+                seconds, df = _timed(lambda: engine.query(windowed, window_params + (params or ())), repeat)
+                results[f"query_last_quarter/{rel[:-4]}"] = {"seconds": seconds, "rows": len(df)}
+                quarter_frames[rel[:-4]] = df
+
+        # Pandas post-processing, on the inputs the app reads (rollup variants where they exist)
+        def frame(name):
+            return frames.get(f"rollup/{name}", frames[name])
+
+        steps = {
+            "customer_metrics": lambda: analytics.customer_metrics(frame("customer_order_data")),
+            "low_stock_risk": lambda: analytics.low_stock_risk(frame("inventory_tab_low_stock_risk"), 15, 1.0),
+            "pareto": lambda: analytics.pareto(frame("top_category"), "category", "total_revenue"),
+            "store_index": lambda: analytics.store_index(
+                frame("store_index_kpi"), frame("store_index_category"), frame("store_index_products"),
+                frame("store_index_coverage")),
+        }
+        for step, fn in steps.items():
+            seconds, _ = _timed(fn, repeat)
+            results[f"pandas/{step}"] = {"seconds": seconds}
+
+        # Preview accuracy: the estimates against the exact monthly KPIs over the same range
+        for label, source in (("all", frames), ("last_quarter", quarter_frames)):
+            sample, sketches = source["preview/customer_order_data"], source["preview/sales_sketch"]
+            seconds, estimates = _timed(lambda: analytics.preview_kpi(sample, sketches), repeat)
+            results[f"preview_accuracy/{label}"] = {
+                "seconds": seconds, **preview_accuracy(estimates, source["main_kpi_summary"])}
+        conn.close()
+    return results
+
+
+def preview_accuracy(estimates: pd.DataFrame, exact: pd.DataFrame) -> dict:
+    """Per preview KPI: mean relative error and the share of months its 95% band covers the exact value."""
+    merged = estimates.assign(month_year=estimates["month_year"].astype(str)).merge(
+        exact.assign(month_year=exact["month_year"].astype(str)), on="month_year", suffixes=("", "_exact"))
+    accuracy = {"months": len(merged)}
+    for col in PREVIEW_KPIS:
+        actual = merged[f"{col}_exact"].astype("float64")
+        miss = (merged[col] - actual).abs()
+        accuracy[f"{col}_rel_error"] = float((miss / actual).mean())
+        accuracy[f"{col}_coverage"] = float((miss <= merged[f"{col}_error"]).mean())
+    return accuracy
+
+
+def low_coverage(current: dict, floor: float) -> list:
+    """[(step, KPI, coverage)] for preview bands that cover the exact KPI in fewer than `floor` of the months."""
+    return [
+        (step, col, r[f"{col}_coverage"])
+        for step, r in current.items() if step.startswith("preview_accuracy/")
+        for col in PREVIEW_KPIS if r[f"{col}_coverage"] < floor
+    ]
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """[(step, baseline seconds, current seconds)] for steps slower than the baseline allows."""
+    regressions = []
+    for step, r in current.items():
+        base = baseline.get(step)
+        if base is None:
+            continue
+        if r["seconds"] > base["seconds"] * (1 + threshold) and r["seconds"] - base["seconds"] > MIN_DELTA_SECONDS:
+            regressions.append((step, base["seconds"], r["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1M")
+    parser.add_argument("--csv-dir", help="benchmark these CSVs instead of generated data")
+    parser.add_argument("--engine", choices=["sqlite", "duckdb"], default="sqlite")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=ingest.PARSE_WORKERS, help="CSV parsing processes")
+    parser.add_argument("--no-compact", action="store_true", help="return query results as fetched (no compact_frame)")
+    parser.add_argument("--no-columnar", action="store_true",
+                        help="fetch SQLite results through sqlite3 batches even when adbc-driver-sqlite is installed")
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--min-coverage", type=float, default=MIN_PREVIEW_COVERAGE,
+                        help="share of months each preview KPI's 95%% band must cover the exact value in")
+    args = parser.parse_args()
+
+    csv_dir = args.csv_dir or os.path.join(ROOT, "bench", "data", args.scale)
+    if not args.csv_dir and not os.path.exists(os.path.join(csv_dir, "sales.csv")):
+        print(f"Generating {args.scale} sales rows into {csv_dir}", file=sys.stderr)
+        generate(csv_dir, SCALES[args.scale])
+
+    columnar = db.adbc_sqlite is not None and not args.no_columnar
+    report = {
+        "scale": None if args.csv_dir else args.scale,
+        "csv_dir": csv_dir,
+        "engine": args.engine,
+        "repeat": args.repeat,
+        "workers": args.workers,
+        "compact": not args.no_compact,
+        "columnar_fetch": args.engine == "sqlite" and columnar,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": run(csv_dir, args.engine, args.repeat, args.workers, not args.no_compact, columnar),
+    }
+
+    payload = json.dumps(report, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    failed = False
+    for step, col, coverage in low_coverage(report["results"], args.min_coverage):
+        print(f"LOW COVERAGE {step} {col}: {coverage:.0%} of months < {args.min_coverage:.0%}", file=sys.stderr)
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(report["results"], baseline, args.threshold)
+        for step, before, after in regressions:
+            print(f"REGRESSION {step}: {before:.3f}s -> {after:.3f}s (+{(after / before - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
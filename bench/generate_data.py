@@ -0,0 +1,150 @@
+"""
+Synthetic CSVs in the layout of csv_files/, at benchmark scale.
+
+    python bench/generate_data.py --scale 10M --out bench/data/10M
+
+Ids are dense and every foreign key points at an existing row, so the output
+loads through ingest.py like the sample files. Sales are skewed the way retail
+data is: a few products, stores and customers account for most rows, and
+volume follows a yearly season with a December peak. Output is deterministic
+for a given seed and row count.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SCALES = {"1M": 1_000_000, "10M": 10_000_000, "100M": 100_000_000}
+CHUNK_ROWS = 1_000_000
+
+CATEGORIES = ["Electronics", "Toys", "Food", "School", "Home", "Apparel"]
+REGIONS = ["North", "East", "Central", "West", "South"]
+REGION_WEIGHTS = [0.30, 0.25, 0.20, 0.20, 0.05]
+GENDERS = ["Male", "Female", "Non-binary"]
+GENDER_WEIGHTS = [0.48, 0.48, 0.04]
+
+START_DATE = "2024-01-01"
+DAYS = 730  # two years of sales
+
+
+def dimension_sizes(sales_rows: int) -> dict:
+    """Row counts of the other tables for a given number of sales rows."""
+    return {
+        "customers": max(500, sales_rows // 20),
+        "products": max(100, min(sales_rows // 1_000, 50_000)),
+        "stores": max(20, min(sales_rows // 20_000, 2_000)),
+        "inventory": max(1_000, sales_rows // 100),
+    }
+
+
+def _zipf_weights(n: int, s: float, rng: np.random.Generator) -> np.ndarray:
+    """Zipf(s) popularity over n ids, shuffled so popularity is unrelated to id order."""
+    w = 1.0 / np.arange(1, n + 1) ** s
+    rng.shuffle(w)
+    return w / w.sum()
+
+
+def _us_dates(dates: pd.DatetimeIndex) -> np.ndarray:
+    # m/d/Y without zero padding, like the sample CSVs
+    return np.array([f"{d.month}/{d.day}/{d.year}" for d in dates], dtype=object)
+
+
+def _write_csv(df: pd.DataFrame, path: str, first: bool):
+    df.to_csv(path, index=False, header=first, mode="w" if first else "a")
+
+
+def generate(out_dir: str, sales_rows: int, seed: int = 7, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Write customers/products/stores/inventory/sales CSVs to out_dir. Returns {table: rows}."""
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = dimension_sizes(sales_rows)
+    rng = np.random.default_rng(seed)
+
+    # Dimensions
+    n_products, n_stores, n_customers = sizes["products"], sizes["stores"], sizes["customers"]
+    product_ids = np.arange(1, n_products + 1)
+    products = pd.DataFrame({
+        "product_id": product_ids,
+        "product_name": [f"Product {i}" for i in product_ids],
+        "category": rng.choice(CATEGORIES, size=n_products),
+        "price": np.clip(rng.lognormal(np.log(60), 0.6, size=n_products), 2, 500).round(2),
+    })
+    _write_csv(products, os.path.join(out_dir, "products.csv"), True)
+
+    store_ids = np.arange(1, n_stores + 1)
+    stores = pd.DataFrame({
+        "store_id": store_ids,
+        "store_name": [f"Store {i:05d}" for i in store_ids],  # store_name is unique
+        "city": [f"City {i % 400 + 1}" for i in store_ids],
+        "region": rng.choice(REGIONS, size=n_stores, p=REGION_WEIGHTS),
+    })
+    _write_csv(stores, os.path.join(out_dir, "stores.csv"), True)
+
+    for start in range(0, n_customers, chunk_rows):
+        ids = np.arange(start + 1, min(start + chunk_rows, n_customers) + 1)
+        customers = pd.DataFrame({
+            "customer_id": ids,
+            "name": [f"Customer {i}" for i in ids],
+            "gender": rng.choice(GENDERS, size=len(ids), p=GENDER_WEIGHTS),
+            "age": rng.integers(18, 80, size=len(ids)),
+            "city": [f"City {i % 5_000 + 1}" for i in ids],
+        })
+        _write_csv(customers, os.path.join(out_dir, "customers.csv"), start == 0)
+
+    # Skew: product popularity and customer activity are Zipf-like, store traffic log-normal
+    product_p = _zipf_weights(n_products, 1.1, rng)
+    customer_p = _zipf_weights(n_customers, 0.8, rng)
+    store_p = rng.lognormal(0, 0.8, size=n_stores)
+    store_p /= store_p.sum()
+
+    # Yearly season peaking in December, plus busier weekends
+    dates = pd.date_range(START_DATE, periods=DAYS, freq="D")
+    day_p = (1 + 0.3 * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 350) / 365)) \
+        * np.where(dates.dayofweek.to_numpy() >= 5, 1.3, 1.0)
+    day_p /= day_p.sum()
+    date_strings = _us_dates(dates)
+
+    inventory = pd.DataFrame({
+        "store_id": rng.choice(store_ids, size=sizes["inventory"], p=store_p),
+        "product_id": rng.choice(product_ids, size=sizes["inventory"]),
+        "stock_quantity": rng.integers(0, 201, size=sizes["inventory"]),
+        "last_updated": date_strings[rng.integers(DAYS - 180, DAYS, size=sizes["inventory"])],
+    })
+    _write_csv(inventory, os.path.join(out_dir, "inventory.csv"), True)
+
+    # Facts, streamed in chunks; each chunk has its own seeded generator
+    sales_path = os.path.join(out_dir, "sales.csv")
+    for chunk_no, start in enumerate(range(0, sales_rows, chunk_rows)):
+        n = min(chunk_rows, sales_rows - start)
+        crng = np.random.default_rng([seed, chunk_no])
+        sales = pd.DataFrame({
+            "sale_id": np.arange(start + 1, start + n + 1),
+            "store_id": crng.choice(store_ids, size=n, p=store_p),
+            "product_id": crng.choice(product_ids, size=n, p=product_p),
+            "customer_id": crng.choice(np.arange(1, n_customers + 1), size=n, p=customer_p),
+            "quantity": np.minimum(crng.geometric(0.45, size=n), 10),
+            "sale_date": date_strings[crng.choice(DAYS, size=n, p=day_p)],
+        })
+        _write_csv(sales, sales_path, chunk_no == 0)
+
+    return {**sizes, "sales": sales_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1M", help="number of sales rows")
+    parser.add_argument("--rows", type=int, help="exact number of sales rows (overrides --scale)")
+    parser.add_argument("--out", help="output directory (default: bench/data/<scale>, or bench/data/<rows> with --rows)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = args.rows or SCALES[args.scale]
+    # a custom row count gets its own directory, so benchmark.py --scale never picks it up
+    label = next((name for name, n in SCALES.items() if n == rows), str(rows))
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", label)
+    written = generate(out_dir, rows, seed=args.seed)
+    print(f"Wrote {out_dir}: " + ", ".join(f"{t} {n:,}" for t, n in written.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.io as pio
+import pyarrow as pa
+
+# ─────────────────────────────
+# In-process caches
+# ─────────────────────────────
+
+
+def frame_fingerprint(df: pd.DataFrame) -> int:
+    """Content hash of a DataFrame (values, index and column names)."""
+    values = int(pd.util.hash_pandas_object(df, index=True).sum()) if len(df) else 0
+    return hash((values, tuple(map(str, df.columns)), tuple(map(str, df.dtypes))))
+
+
+class FigureCache:
+    """
+    LRU cache of built Plotly figures, keyed by (builder, input-data fingerprint, parameters).
+    Figures are stored serialized to JSON, so every hit hands out a fresh Figure
+    that callers may modify freely.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, builder, df: pd.DataFrame, **params):
+        """
+        Return builder(df, **params), building it only on a cache miss.
+        Builders may return a figure or a (figure, *extras) tuple; extras are cached as-is.
+        """
+        key = (builder.__qualname__, frame_fingerprint(df), tuple(sorted(params.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            result = builder(df, **params)
+            fig, extras = (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+            entry = (fig.to_json(), extras)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+
+        fig = pio.from_json(entry[0])
+        return fig if entry[1] is None else (fig, *entry[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if callable(getattr(value, "nbytes", None)):  # objects that report their own size
+        return int(value.nbytes())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    LRU cache of query results keyed by (key, versions of the tables the result was
+    computed from). Entries never expire on their own: a new table version simply
+    misses, and prune() drops entries built from versions that are no longer current.
+    Capacity is bounded by entry count and by total in-memory size.
+    Cached values are shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (key, versions) -> (value, versions, nbytes)
+        self._computing = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def _lookup(self, full_key):
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+            return entry
+
+    def get_or_compute(self, key, versions: dict, compute):
+        """
+        (value, served from cache) for `key` at the given {table: version}, calling
+        compute() on a miss. Concurrent misses on one key compute it once.
+        """
+        value, hit, _ = self.get_or_compute_sized(key, versions, compute)
+        return value, hit
+
+    def get_or_compute_sized(self, key, versions: dict, compute):
+        """get_or_compute() plus the value's in-memory size, measured once when it was computed."""
+        full_key = (key, tuple(sorted(versions.items())))
+        entry = self._lookup(full_key)
+        if entry is not None:
+            return entry[0], True, entry[2]
+
+        with self._lock:
+            key_lock = self._computing.setdefault(full_key, threading.Lock())
+        with key_lock:
+            entry = self._lookup(full_key)  # computed by another thread while we waited
+            if entry is not None:
+                return entry[0], True, entry[2]
+            try:
+                value = compute()
+                size = _nbytes(value)
+                with self._lock:
+                    self.misses += 1
+                    self._entries[full_key] = (value, dict(versions), size)
+                    self.nbytes += size
+                    while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+                        _, (_, _, evicted) = self._entries.popitem(last=False)
+                        self.nbytes -= evicted
+            finally:
+                with self._lock:
+                    self._computing.pop(full_key, None)
+        return value, False, size
+
+    def prune(self, current: dict) -> int:
+        """
+        Drop entries computed from a table whose version differs from `current`
+        {table: version}, i.e. tables a rebuild actually changed. Returns how many.
+        """
+        with self._lock:
+            stale = [k for k, (_, versions, _) in self._entries.items()
+                     if any(current.get(t) != v for t, v in versions.items())]
+            for k in stale:
+                self.nbytes -= self._entries.pop(k)[2]
+            self.invalidated += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "bytes": self.nbytes,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "invalidated": self.invalidated}
+
+
+ATTRS_KEY = b"frame_attrs"
+
+
+class DiskCache:
+    """
+    Query results as Arrow IPC files in `directory`, so they survive restarts.
+    Files are named by a hash of (build version, key, table versions) and read back
+    memory-mapped; a new `build_version` (code that shapes the tables and results
+    changed) misses every old file. When the directory grows past `max_bytes`, the
+    least recently used files (oldest mtime; a hit refreshes it) are deleted first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3, build_version: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.build_version = build_version
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.nbytes = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith(".arrow"))
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _path(self, key, versions: dict) -> str:
+        digest = hashlib.sha1(repr((self.build_version, key, sorted(versions.items()))).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.arrow")
+
+    def get(self, key, versions: dict) -> pd.DataFrame | None:
+        path = self._path(key, versions)
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = table.to_pandas()
+            df.attrs.update(json.loads((table.schema.metadata or {}).get(ATTRS_KEY, b"{}")))
+            os.utime(path)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, key, versions: dict, df: pd.DataFrame):
+        path = self._path(key, versions)
+        table = pa.Table.from_pandas(df)
+        # attrs (e.g. bytes_saved) ride along in the schema metadata
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), ATTRS_KEY: json.dumps(df.attrs)})
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        with self._lock:
+            try:
+                self.nbytes -= os.path.getsize(path)  # overwriting an existing entry
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self.nbytes += os.path.getsize(path)
+            if self.nbytes > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> int:
+        """Delete every cached file; returns how many."""
+        removed = 0
+        with self._lock:
+            for e in os.scandir(self.directory):
+                if e.name.endswith(".arrow"):
+                    try:
+                        os.remove(e.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            self.nbytes = 0
+        return removed
+
+    def _evict(self):
+        # rescan: other processes may share the directory
+        files = sorted((e.stat().st_mtime, e.stat().st_size, e.path)
+                       for e in os.scandir(self.directory) if e.name.endswith(".arrow"))
+        self.nbytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.nbytes -= size
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes": self.nbytes, "max_bytes": self.max_bytes, "hits": self.hits,
+                    "misses": self.misses, "evicted": self.evicted}
@@ -0,0 +1,155 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import analytics
+
+# ─────────────────────────────
+# Dashboard datasets (no Streamlit)
+# ─────────────────────────────
+# Every dataset the dashboard shows, as plain DataFrames computed on a db engine.
+# precompute.py writes them to a results directory after each data load and the
+# app reads them from there when they match the current data version.
+
+# dataset -> query file (queries/<name>.txt, or its rollup/dialect variant)
+QUERY_DATASETS = {
+    "kpi": "main_kpi_summary",
+    "top_category": "top_category",
+    "region_category": "region_category_rev",
+    "all_stores": "all_stores_performance",
+    "store_kpi": "store_index_kpi",
+    "store_category": "store_index_category",
+    "store_products": "store_index_products",
+    "store_coverage": "store_index_coverage",
+    "low_stock": "inventory_tab_low_stock_risk",
+    "stock_levels": "inventory_category_stock_levels",
+    "customer_orders": "customer_order_data",
+    "customer_revenue": "customer_revenue",
+}
+
+# Defaults of the dashboard controls, used for the precomputed views
+DEFAULT_RISK_PCT = 15
+DEFAULT_COVERAGE_MONTHS = 1.0
+DEFAULT_TOP_CUSTOMERS = 5
+PARETO_CUTOFF = 0.80
+
+MANIFEST = "manifest.json"
+
+
+def query_path(queries_dir: str, name: str, dialect: str | None = None, use_rollup: bool = True) -> str:
+    """
+    Path of a query file, preferring its rollup variant when one exists and,
+    within that, the engine's dialect override (queries/<dialect>/...).
+    """
+    for variant in (["rollup"] if use_rollup else []) + [""]:
+        for override in ([dialect] if dialect else []) + [""]:
+            path = os.path.join(queries_dir, override, variant, f"{name}.txt")
+            if os.path.exists(path):
+                return path
+    raise FileNotFoundError(f"No query file for {name!r} in {queries_dir}")
+
+
+def load_query(engine, queries_dir: str, name: str, use_rollup: bool = True, params: tuple | None = None) -> pd.DataFrame:
+    with open(query_path(queries_dir, name, engine.dialect, use_rollup), "r", encoding="utf-8") as f:
+        return engine.query(f.read(), params)
+
+
+def compute_all(engine, queries_dir: str, use_rollup: bool = True) -> dict:
+    """
+    {dataset: DataFrame} for the whole dashboard: every QUERY_DATASETS result (the
+    store_* ones cover every store) plus the pandas-derived views at the default
+    control settings.
+    """
+    results = {key: load_query(engine, queries_dir, name, use_rollup) for key, name in QUERY_DATASETS.items()}
+
+    metrics = analytics.customer_metrics(results["customer_orders"])
+    results["cohort_retention"] = metrics["cohort_retention"]
+    results["customer_segments"] = metrics["seg_table"]
+    results["customer_summary"] = pd.DataFrame([{
+        "total_customers": metrics["total_customers"],
+        "repeat_customers": metrics["repeat_customers"],
+        "repeat_rate": metrics["repeat_rate"],
+    }])
+    results["low_stock_risk"] = analytics.low_stock_risk(
+        results["low_stock"], DEFAULT_RISK_PCT, DEFAULT_COVERAGE_MONTHS)["at_risk"]
+    results["stock_coverage"] = analytics.stock_coverage(results["stock_levels"])
+    results["pareto"] = analytics.pareto(results["top_category"], "category", "total_revenue", PARETO_CUTOFF)["table"]
+    results["top_customers"] = analytics.top_customer_rows(load_query(
+        engine, queries_dir, "customer_top_k", use_rollup, params=("[]", "[]", DEFAULT_TOP_CUSTOMERS)))
+    return results
+
+
+def customer_metrics(results: dict) -> dict:
+    """The analytics.customer_metrics() dict, rebuilt from computed or stored results."""
+    summary = results["customer_summary"].iloc[0]
+    return {
+        "cohort_retention": results["cohort_retention"],
+        "total_customers": int(summary["total_customers"]),
+        "repeat_customers": int(summary["repeat_customers"]),
+        "repeat_rate": float(summary["repeat_rate"]),
+        "seg_table": results["customer_segments"],
+    }
+
+
+def store_index(results: dict) -> dict:
+    return analytics.store_index(results["store_kpi"], results["store_category"], results["store_products"],
+                                 results.get("store_coverage"))
+
+
+# ─────────────────────────────
+# Results directory
+# ─────────────────────────────
+def write_results(results: dict, out_dir: str, data_version: str) -> dict:
+    """
+    Write each dataset to <out_dir>/<dataset>.parquet, then the manifest naming the
+    data version they were computed from. Files are swapped in atomically and the
+    manifest goes last, so readers see either the old or the new version.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entries = {}
+    for key, df in results.items():
+        # Parquet needs string column names; the cohort matrix has integer periods
+        int_columns = len(df.columns) > 0 and all(isinstance(c, int) for c in df.columns)
+        out = df.rename(columns=str) if int_columns else df
+        path = os.path.join(out_dir, f"{key}.parquet")
+        out.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        entries[key] = {"rows": len(df), "int_columns": int_columns, "columns_name": df.columns.name}
+    manifest = {
+        "data_version": data_version,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "datasets": entries,
+    }
+    with open(os.path.join(out_dir, MANIFEST + ".tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(out_dir, MANIFEST + ".tmp"), os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def manifest_mtime(out_dir: str) -> float | None:
+    path = os.path.join(out_dir, MANIFEST)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def read_results(out_dir: str, data_version: str | None = None) -> dict | None:
+    """
+    {dataset: DataFrame} from a results directory, or None when there is none or it
+    was computed from a different data version than `data_version`.
+    """
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if data_version is not None and manifest["data_version"] != data_version:
+        return None
+    results = {}
+    for key, entry in manifest["datasets"].items():
+        df = pd.read_parquet(os.path.join(out_dir, f"{key}.parquet"))
+        if entry["int_columns"]:
+            df.columns = df.columns.astype(int)
+        df.columns.name = entry["columns_name"]
+        results[key] = df
+    return results
@@ -0,0 +1,313 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+try:  # optional columnar engine
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:  # optional columnar fetch: SQLite results as Arrow tables straight from the driver
+    from adbc_driver_sqlite import dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+# ─────────────────────────────
+# SQLite connections
+# ─────────────────────────────
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024  # bytes
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024  # page cache per connection
+
+
+def open_writer(db_path: str) -> sqlite3.Connection:
+    """The single connection allowed to modify the database (used by the build step)."""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # WAL lets readers keep querying their snapshot while a rebuild writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # bulk loads and index builds keep their working set of pages in memory
+    conn.execute(f"PRAGMA cache_size=-{DEFAULT_CACHE_SIZE_KIB}")
+    return conn
+
+
+def open_reader(db_path: str, mmap_size: int = DEFAULT_MMAP_SIZE, cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+                columnar: bool = False):
+    """
+    A read-only connection: sqlite3, or with `columnar` an ADBC connection whose
+    results come back as Arrow columns (needs adbc-driver-sqlite).
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    pragmas = [f"PRAGMA mmap_size={int(mmap_size)}", f"PRAGMA cache_size=-{int(cache_size_kib)}",
+               "PRAGMA temp_store=MEMORY"]
+    if columnar:
+        # autocommit: no read transaction left open to pin an old snapshot of the WAL
+        conn = adbc_sqlite.connect(uri, autocommit=True)
+        with conn.cursor() as cursor:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+                cursor.fetchall()
+        return conn
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of read-only connections. Connections are opened lazily up to
+    `size`; callers beyond that wait for one to be returned, and the wait is recorded.
+    They are columnar (ADBC, see open_reader()) by default when the driver is installed.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB, columnar: bool = adbc_sqlite is not None):
+        self.db_path = db_path
+        self.size = size
+        self.columnar = columnar
+        self._mmap_size = mmap_size
+        self._cache_size_kib = cache_size_kib
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _acquire(self, timeout: float | None) -> tuple:
+        """(connection, seconds spent blocked waiting for one to be returned)."""
+        with self._lock:
+            reserved = self._idle.empty() and self._opened < self.size
+            if reserved:
+                self._opened += 1
+        if reserved:
+            # opened outside the lock: connection setup is not a wait and doesn't block other callers
+            try:
+                return open_reader(self.db_path, self._mmap_size, self._cache_size_kib, self.columnar), 0.0
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            waited = time.perf_counter() - started
+            with self._lock:
+                self._timeouts += 1
+                self._record_wait(waited)
+            raise TimeoutError(f"all {self.size} pooled connections to {self.db_path} stayed busy "
+                               f"for {waited:.1f}s") from None
+        return conn, time.perf_counter() - started
+
+    def _record_wait(self, waited: float):
+        # caller holds self._lock
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        if waited > 0.001:
+            self._waits += 1
+
+    @contextmanager
+    def connection(self, timeout: float | None = 30.0):
+        """Check out a connection; raises TimeoutError if none is returned within `timeout` seconds."""
+        conn, waited = self._acquire(timeout)
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._record_wait(waited)
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            attempts = self._checkouts + self._timeouts
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "waits": self._waits,
+                # over every attempt, including the ones that timed out
+                "avg_wait_ms": (self._wait_total / attempts * 1000) if attempts else 0.0,
+                "max_wait_ms": self._wait_max * 1000,
+            }
+
+
+# ─────────────────────────────
+# Result frames
+# ─────────────────────────────
+FETCH_BATCH_ROWS = 10_000
+# String columns with at most this share of distinct values become categoricals
+DICTIONARY_MAX_RATIO = 0.5
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _arrow_batch(values: tuple) -> pa.Array:
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # SQLite is dynamically typed; a column mixing text and numbers comes back as text
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _arrow_column(batches: list) -> pa.ChunkedArray:
+    types = {a.type for a in batches} - {pa.null()}
+    if not types:
+        target = pa.null()
+    elif len(types) == 1:
+        target = types.pop()
+    else:
+        # e.g. integers in one batch and reals in the next
+        target = pa.float64() if types <= {pa.int64(), pa.float64()} else pa.string()
+    return pa.chunked_array([a if a.type == target else a.cast(target) for a in batches], type=target)
+
+
+def fetch_frame(cursor, batch_rows: int = FETCH_BATCH_ROWS) -> pd.DataFrame:
+    """
+    An executed sqlite3 cursor's rows as a DataFrame, fetched `batch_rows` at a time
+    into per-column Arrow arrays, so only one batch of row tuples exists at once rather
+    than the whole result. Types follow pd.read_sql_query: integer columns with NULLs
+    become float.
+    """
+    if cursor.description is None:
+        return pd.DataFrame()
+    names = [d[0] for d in cursor.description]
+    batches = [[] for _ in names]
+    while rows := cursor.fetchmany(batch_rows):
+        for column, values in zip(batches, zip(*rows)):
+            column.append(_arrow_batch(values))
+    return pa.table([_arrow_column(b) for b in batches], names=names).to_pandas()
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with low-cardinality string columns (category, region, store_name, ...)
+    dictionary-encoded as categoricals, int64 columns narrowed to int32 when they fit
+    (never further, so later arithmetic stays clear of overflow), and floats downcast
+    to float32 where that loses nothing. The bytes saved are in attrs["bytes_saved"].
+    """
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    out = {}
+    for i, (name, s) in enumerate(df.items()):
+        if pd.api.types.is_string_dtype(s) and len(s) > 1:  # inferred from values: blob columns stay as they are
+            if s.nunique(dropna=False) <= len(s) * DICTIONARY_MAX_RATIO:
+                s = s.astype("category")
+        elif s.dtype == "int64" and len(s) and INT32_MIN <= s.min() and s.max() <= INT32_MAX:
+            s = s.astype("int32")
+        elif s.dtype == "float64":
+            f32 = s.astype("float32")
+            if f32.astype("float64").equals(s):
+                s = f32
+        out[i] = s
+    compact = pd.DataFrame(out, index=df.index)
+    compact.columns = df.columns
+    compact.attrs["bytes_saved"] = before - int(compact.memory_usage(index=True, deep=True).sum())
+    return compact
+
+
+# ─────────────────────────────
+# Query engines
+# ─────────────────────────────
+# Every engine runs the same queries/*.txt files; `dialect` names the
+# queries/<dialect>/ directory holding its per-engine overrides (None = plain SQLite SQL).
+
+
+class SQLiteEngine:
+    """
+    Queries on the pooled read-only SQLite connections. Columnar connections hand
+    results over as Arrow tables; sqlite3 ones are fetched in batches into Arrow
+    columns (fetch_frame()). With
+    `compact`, every result is returned as a compact_frame().
+    """
+
+    name = "sqlite"
+    dialect = None
+
+    def __init__(self, pool: ConnectionPool, compact: bool = True):
+        self.pool = pool
+        self.compact = compact
+
+    def query(self, sql: str, params: tuple | None = None) -> pd.DataFrame:
+        with self.pool.connection() as conn:
+            if self.pool.columnar:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    df = cursor.fetch_arrow_table().to_pandas()
+            else:
+                cursor = conn.execute(sql, params or ())
+                try:
+                    df = fetch_frame(cursor)
+                finally:
+                    cursor.close()
+        return compact_frame(df) if self.compact else df
+
+
+class DuckDBEngine:
+    """
+    Queries with DuckDB over the Parquet export of the database (one view per
+    table file), so GROUP BY-heavy queries run on a vectorized, multi-threaded
+    columnar executor. Views read the files at query time, so a re-export is
+    picked up without reopening the engine, and tables exported later get views on
+    their first query. `compact` as for SQLiteEngine.
+    """
+
+    name = "duckdb"
+    dialect = "duckdb"
+
+    def __init__(self, parquet_dir: str, threads: int = 4, compact: bool = True):
+        self.compact = compact
+        if duckdb is None:
+            raise RuntimeError("The duckdb engine needs the duckdb package (pip install duckdb).")
+        self._conn = duckdb.connect(":memory:", config={"threads": threads})
+        self._dir = Path(parquet_dir)
+        self._lock = threading.Lock()
+        self._views = set()
+        self._listed = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Create views for table files exported since the last call (e.g. the derived
+        tables of a first build). Runs before every query; a stat when nothing changed.
+        """
+        try:
+            listed = self._dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if listed == self._listed:
+                return
+            for path in sorted(self._dir.glob("*.parquet")):
+                if path.stem not in self._views:
+                    self._conn.execute(
+                        f"CREATE VIEW {path.stem} AS SELECT * FROM read_parquet('{path.resolve().as_posix()}')")
+                    self._views.add(path.stem)
+            self._listed = listed
+
+    def query(self, sql: str, params: tuple | None = None) -> pd.DataFrame:
+        self.refresh()
+        # a cursor is a per-call connection to the same in-memory catalog, so threads don't share state
+        cursor = self._conn.cursor()
+        try:
+            df = cursor.execute(sql, list(params or ())).df()
+            # SUM over integers is HUGEINT in DuckDB and arrives as float; match SQLite's integers
+            for col, desc in zip(df.columns, cursor.description):
+                if str(desc[1]) == "HUGEINT":
+                    df[col] = df[col].astype("Int64" if df[col].isna().any() else "int64")
+            return compact_frame(df) if self.compact else df
+        finally:
+            cursor.close()
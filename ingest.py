@@ -0,0 +1,786 @@
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import sketch
+
+# ─────────────────────────────
+# CSV -> SQLite ingestion
+# ─────────────────────────────
+TABLES = ["customers", "inventory", "products", "sales", "stores"]
+
+# Files that only ever grow at the end; a change to these is loaded as a tail append
+# when the previously ingested prefix is untouched.
+APPEND_ONLY_TABLES = {"sales"}
+# Their natural keys: a re-delivered key replaces the stored row, whose date may be older.
+APPEND_KEYS = {"sales": "sale_id"}
+
+# Declared per-table schema; parsing with explicit dtypes avoids per-value type inference.
+SCHEMAS = {
+    "customers": {"customer_id": "int64", "name": str, "gender": str, "age": "Int64", "city": str},
+    "inventory": {"store_id": "int64", "product_id": "int64", "stock_quantity": "int64", "last_updated": str},
+    "products": {"product_id": "int64", "product_name": str, "category": str, "price": "float64"},
+    "sales": {"sale_id": "int64", "store_id": "int64", "product_id": "int64", "customer_id": "int64",
+              "quantity": "int64", "sale_date": str},
+    "stores": {"store_id": "int64", "store_name": str, "city": str, "region": str},
+}
+DATE_COLUMNS = {"inventory": ["last_updated"], "sales": ["sale_date"]}
+DATE_FORMAT = "%m/%d/%Y"
+
+# Rows parsed and written per step; peak memory is one chunk whatever the file size
+# (a parallel load holds at most one parsed shard per worker, plus the one being written).
+CHUNK_ROWS = 100_000
+
+# CSV parsing (dtypes, date conversion) runs in this many worker processes on large loads,
+# over shards of about SHARD_BYTES; smaller loads are parsed inline, and so is everything
+# with fewer than 2 usable CPUs. Capped rather than one per core: the single SQLite writer
+# can't keep up with more, and each adds a parsed shard in memory.
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+PARSE_WORKERS = 1 if _CPUS < 2 else min(4, _CPUS)
+SHARD_BYTES = 16 * 1024 * 1024
+
+# Explicit DDL: integer primary keys on every table with a natural key, dates as ISO-8601 text.
+DDL = {
+    "customers": """CREATE TABLE customers (
+        customer_id INTEGER PRIMARY KEY,
+        name TEXT,
+        gender TEXT,
+        age INTEGER,
+        city TEXT
+    )""",
+    "inventory": """CREATE TABLE inventory (
+        store_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        stock_quantity INTEGER,
+        last_updated TEXT CHECK (last_updated = date(last_updated))
+    )""",
+    "products": """CREATE TABLE products (
+        product_id INTEGER PRIMARY KEY,
+        product_name TEXT,
+        category TEXT,
+        price REAL
+    )""",
+    "sales": """CREATE TABLE sales (
+        sale_id INTEGER PRIMARY KEY,
+        store_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        quantity INTEGER,
+        sale_date TEXT CHECK (sale_date = date(sale_date))
+    )""",
+    "stores": """CREATE TABLE stores (
+        store_id INTEGER PRIMARY KEY,
+        store_name TEXT NOT NULL,
+        city TEXT,
+        region TEXT
+    )""",
+}
+
+# Indexes matched to the shipped queries. sales has one: idx_sales_date holds every
+# column, clustered by date, so a date range reads only its own span of pages. The
+# whole-table aggregates scan sales once either way (measured on 1M rows: three more
+# covering indexes saved 3% of query time for twice the file size, and narrowed ones
+# were slower than a scan), and each extra index is another copy to maintain on append.
+INDEXES = {
+    "inventory": [
+        "CREATE INDEX IF NOT EXISTS idx_inventory_product ON inventory (product_id, stock_quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_store ON inventory (store_id, product_id, stock_quantity)",
+    ],
+    "products": [
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category, product_id, price)",
+    ],
+    "sales": [
+        "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (sale_date, store_id, product_id, customer_id, quantity)",
+    ],
+    "stores": [
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_stores_name ON stores (store_name)",
+    ],
+}
+
+# Indexes of earlier builds, dropped the next time their table loads
+RETIRED_INDEXES = {"sales": ["idx_sales_store_date", "idx_sales_product_date", "idx_sales_customer_date"]}
+
+STATE_TABLE = "_ingest_state"
+PLAN_TABLE = "_query_plans"
+
+# Pre-aggregated facts at store x product x month grain. sale_id is unique, so
+# order counts stay additive across the grain (SUM(orders) == COUNT(DISTINCT sale_id)).
+ROLLUP_TABLE = "sales_monthly"
+ROLLUP_DDL = f"""CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    store_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    month TEXT,
+    revenue REAL,
+    units INTEGER,
+    orders INTEGER
+)"""
+ROLLUP_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS idx_{ROLLUP_TABLE}_store ON {ROLLUP_TABLE} (store_id, month)",
+    f"CREATE INDEX IF NOT EXISTS idx_{ROLLUP_TABLE}_month ON {ROLLUP_TABLE} (month)",
+]
+ROLLUP_SELECT = """
+    SELECT s.store_id, s.product_id, strftime('%Y-%m', s.sale_date) AS month,
+           SUM(s.quantity * p.price) AS revenue, SUM(s.quantity) AS units, COUNT(s.sale_id) AS orders
+    FROM sales s JOIN products p ON p.product_id = s.product_id
+"""
+
+# Tables the rollup is computed from; a change to either invalidates it
+ROLLUP_SOURCES = ("sales", "products")
+
+# Demand statistics derived from the rollup at build time, shared by the inventory
+# queries: per product, and per store x product. "Recent" is the last
+# DEMAND_RECENT_MONTHS months up to the latest month with sales.
+DEMAND_RECENT_MONTHS = 3
+DEMAND_TABLES = {"demand_product": ["product_id"], "demand_store_product": ["store_id", "product_id"]}
+DEMAND_COLUMNS = """
+    months INTEGER,
+    units INTEGER,
+    avg_monthly_sales REAL,
+    recent_units INTEGER,
+    recent_avg_monthly_sales REAL"""
+# Units per (keys, month); per product this sums the rollup over stores first
+DEMAND_MONTHLY = {
+    "demand_product": f"SELECT product_id, month, SUM(units) AS units FROM {ROLLUP_TABLE} GROUP BY product_id, month",
+    "demand_store_product": f"SELECT store_id, product_id, month, units FROM {ROLLUP_TABLE}",
+}
+
+# Fast-preview inputs built from sales alone: each month's exact sale count (sale_id
+# is unique, so it is the order count) with a HyperLogLog sketch of its distinct
+# customers, and a sample of sales stratified by cohort (first purchase month) and size
+# band (number of sales: 1, 2-3, 4-7, ...), keeping every sale of up to
+# SAMPLE_CUSTOMERS_PER_STRATUM customers per stratum. Customer spend is heavy-tailed:
+# the few heaviest buyers fill the top bands on their own and are kept whole, instead
+# of being missed by a per-cohort sample. Each sampled sale carries
+# weight = stratum size / customers kept.
+SKETCH_TABLE = "sales_sketch"
+SKETCH_DDL = f"""CREATE TABLE {SKETCH_TABLE} (
+    month TEXT PRIMARY KEY,
+    sales INTEGER,
+    customers BLOB
+)"""
+SAMPLE_TABLE = "sales_sample"
+SAMPLE_CUSTOMERS_PER_STRATUM = 50
+_SIZE_BAND = "CASE " + " ".join(f"WHEN lines >= {1 << k} THEN {k}" for k in range(30, 0, -1)) + " ELSE 0 END"
+# The customers kept go into a temp table keyed on customer_id first: sales has no
+# customer index, so one pass over sales can then look each sale up by rowid.
+SAMPLE_PICKED = "temp.sample_customers"
+SAMPLE_PICK = f"""
+    CREATE TABLE {SAMPLE_PICKED} (customer_id INTEGER PRIMARY KEY, cohort TEXT, stratum TEXT, weight REAL)"""
+SAMPLE_PICK_SELECT = f"""
+    WITH firsts AS (
+        SELECT customer_id, MIN(strftime('%Y-%m', sale_date)) AS cohort, COUNT(*) AS lines
+        FROM sales WHERE sale_date IS NOT NULL GROUP BY customer_id
+    ), strata AS (
+        SELECT customer_id, cohort, cohort || '/' || ({_SIZE_BAND}) AS stratum FROM firsts
+    ), ranked AS (
+        -- a fixed pseudo-random order of customers within each stratum
+        SELECT customer_id, cohort, stratum, COUNT(*) OVER (PARTITION BY stratum) AS stratum_size,
+               ROW_NUMBER() OVER (PARTITION BY stratum ORDER BY (customer_id * 2654435761) % 4294967296, customer_id) AS pick
+        FROM strata
+    )
+    SELECT customer_id, cohort, stratum, stratum_size * 1.0 / MIN(stratum_size, ?) AS weight
+    FROM ranked WHERE pick <= ?
+"""
+SAMPLE_SELECT = f"""
+    SELECT s.sale_id, s.store_id, s.product_id, s.customer_id, s.quantity, s.sale_date, p.cohort, p.stratum, p.weight
+    FROM sales s JOIN {SAMPLE_PICKED} p ON p.customer_id = s.customer_id
+    WHERE s.sale_date IS NOT NULL
+"""
+DATE_COLUMNS[SAMPLE_TABLE] = DATE_COLUMNS["sales"]  # exported with real dates, like sales
+PREVIEW_TABLES = [SKETCH_TABLE, SAMPLE_TABLE]
+PREVIEW_SOURCES = ("sales",)
+
+# Every table a query can read; derived ones change with their sources
+DERIVED_TABLES = [ROLLUP_TABLE] + list(DEMAND_TABLES) + PREVIEW_TABLES
+
+# Tables exported to Parquet in date order: each row group then covers a narrow
+# range of dates and a date filter skips the others on their min/max statistics.
+CLUSTER_KEYS = {"sales": "sale_date", SAMPLE_TABLE: "sale_date", ROLLUP_TABLE: "month", SKETCH_TABLE: "month"}
+
+# Tables exported to Parquet for the columnar query engine
+COLUMNAR_TABLES = TABLES + DERIVED_TABLES
+
+# Blocks of the previously ingested prefix that must be unchanged for an append to be trusted:
+# the header, the bytes just before the stored offset and PREFIX_PROBES blocks spread over the rest.
+TAIL_PROBE_BYTES = 4096
+PREFIX_PROBES = 64
+
+
+def csv_path(csv_dir: str, name: str) -> str:
+    return os.path.join(csv_dir, f"{name}.csv")
+
+
+def csv_signature(csv_dir: str, tables: list[str] = TABLES) -> tuple:
+    """Lightweight (table, mtime, size) signature of the input CSVs."""
+    sig = []
+    for t in tables:
+        stat = os.stat(csv_path(csv_dir, t))
+        sig.append((t, stat.st_mtime, stat.st_size))
+    return tuple(sig)
+
+
+def data_version(signature: tuple) -> str:
+    """Short id for a CSV signature; keys caches and precomputed results to one state of the data."""
+    return hashlib.sha1(repr(signature).encode()).hexdigest()[:12]
+
+
+def table_versions(signature: tuple) -> dict:
+    """
+    {table: version} from a CSV signature. A table's version only changes with its own
+    CSV; derived tables (the rollup and the demand tables built from it) change with
+    any of the rollup's sources, and the fast-preview tables with sales.
+    """
+    versions = {t: data_version(entry) for t, *entry in signature}
+    derived = data_version(tuple(versions.get(t) for t in ROLLUP_SOURCES))
+    versions.update(dict.fromkeys(DERIVED_TABLES, derived))
+    versions.update(dict.fromkeys(PREVIEW_TABLES, data_version(tuple(versions.get(t) for t in PREVIEW_SOURCES))))
+    return versions
+
+
+def tables_read(sql: str) -> tuple:
+    """Names of the database tables a query mentions, in a stable order."""
+    words = set(re.findall(r"\w+", sql))
+    return tuple(t for t in TABLES + DERIVED_TABLES if t in words)
+
+
+def _demand_select(name: str) -> str:
+    # one DEMAND_TABLES row per key from the rollup; params: recent cutoff month (twice), DEMAND_RECENT_MONTHS
+    key_list = ", ".join(DEMAND_TABLES[name])
+    return f"""SELECT {key_list}, COUNT(*) AS months, SUM(units) AS units, AVG(units) AS avg_monthly_sales,
+               SUM(CASE WHEN month > ? THEN units ELSE 0 END) AS recent_units,
+               SUM(CASE WHEN month > ? THEN units ELSE 0 END) * 1.0 / ? AS recent_avg_monthly_sales
+        FROM ({DEMAND_MONTHLY[name]}) GROUP BY {key_list}"""
+
+
+# How restrict_months() cuts each dated table: the CTE body standing in for it and the
+# bounds filling its placeholders. The rollup comes before the demand tables built on it.
+WINDOW_SHADOWS = {
+    "sales": ("SELECT * FROM main.sales WHERE sale_date >= ? AND sale_date < ?", "days"),
+    SAMPLE_TABLE: (f"SELECT * FROM main.{SAMPLE_TABLE} WHERE sale_date >= ? AND sale_date < ?", "days"),
+    ROLLUP_TABLE: (f"SELECT * FROM main.{ROLLUP_TABLE} WHERE month BETWEEN ? AND ?", "months"),
+    SKETCH_TABLE: (f"SELECT * FROM main.{SKETCH_TABLE} WHERE month BETWEEN ? AND ?", "months"),
+    **{name: (_demand_select(name), "recent") for name in DEMAND_TABLES},
+}
+
+
+def restrict_months(sql: str, months: tuple[str, str] | None) -> tuple[str, tuple]:
+    """
+    (sql, params) for `sql` over the months first..last ('YYYY-MM', inclusive). Each
+    dated table the query reads is shadowed by a CTE of the same name holding only
+    those months, and the demand tables are recomputed from the shadowed rollup, so
+    every query file runs unchanged. The params go before the query's own;
+    months=None returns the query as it is.
+    """
+    if months is None:
+        return sql, ()
+    first, last = months
+    bounds = {
+        "days": (f"{first}-01", (pd.Period(last, "M") + 1).strftime("%Y-%m-01")),
+        "months": (first, last),
+        "recent": ((pd.Period(last, "M") - DEMAND_RECENT_MONTHS).strftime("%Y-%m"),) * 2 + (DEMAND_RECENT_MONTHS,),
+    }
+    read = set(tables_read(sql))
+    if read & set(DEMAND_TABLES):
+        read.add(ROLLUP_TABLE)
+    ctes, params = [], ()
+    for name, (body, bound) in WINDOW_SHADOWS.items():
+        if name in read:
+            ctes.append(f"{name} AS ({body})")
+            params += bounds[bound]
+    if not ctes:
+        return sql, ()
+    head = re.match(r"\s*WITH\s+", sql, re.IGNORECASE)
+    return "WITH " + ",\n".join(ctes) + (",\n" + sql[head.end():] if head else "\n" + sql), params
+
+
+def _fingerprint(path: str, offset: int) -> str:
+    """
+    Hash of the bytes before `offset` that an append must leave alone: the header, the
+    PREFIX_PROBES blocks spread evenly over the prefix and the block right before
+    `offset` (detects rewrites of an 'append-only' file without reading all of it).
+    """
+    starts = {0, max(0, offset - TAIL_PROBE_BYTES)}
+    starts.update(offset * i // PREFIX_PROBES for i in range(1, PREFIX_PROBES))
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for start in sorted(starts):
+            f.seek(start)
+            digest.update(f.read(min(TAIL_PROBE_BYTES, offset - start)))
+    return digest.hexdigest()
+
+
+def _ends_with_newline(path: str, offset: int) -> bool:
+    if offset == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(offset - 1)
+        return f.read(1) == b"\n"
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file, so a CSV can be parsed up to a known size."""
+
+    def __init__(self, path: str, start: int, end: int):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._remaining)
+        if n <= 0:
+            return 0
+        data = self._f.read(n)
+        b[: len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def _ensure_state_table(conn: sqlite3.Connection):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            mtime REAL,
+            size INTEGER,
+            row_count INTEGER,
+            fingerprint TEXT
+        )"""
+    )
+
+
+def load_state(conn: sqlite3.Connection) -> dict:
+    """Per-table ingest watermark: {table: {mtime, size, row_count, fingerprint}}."""
+    _ensure_state_table(conn)
+    rows = conn.execute(f"SELECT table_name, mtime, size, row_count, fingerprint FROM {STATE_TABLE}").fetchall()
+    return {r[0]: {"mtime": r[1], "size": r[2], "row_count": r[3], "fingerprint": r[4]} for r in rows}
+
+
+def synced_signature(conn: sqlite3.Connection, tables: list[str] = TABLES) -> tuple:
+    """csv_signature() of the CSVs as they were last ingested, from the watermarks ((table, None, None) if never)."""
+    state = load_state(conn)
+    return tuple((t, state[t]["mtime"], state[t]["size"]) if t in state else (t, None, None) for t in tables)
+
+
+def reset_state(conn: sqlite3.Connection):
+    """Forget all watermarks so the next sync reloads every table from scratch."""
+    _ensure_state_table(conn)
+    with conn:
+        conn.execute(f"DELETE FROM {STATE_TABLE}")
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _convert_dates(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    # dates arrive as m/d/Y and are stored as ISO text; a chunk holds few distinct
+    # days, so each is converted once and mapped back
+    for col in DATE_COLUMNS.get(name, []):
+        distinct = df[col].dropna().unique()
+        iso = pd.to_datetime(pd.Series(distinct), format=DATE_FORMAT, errors="coerce").dt.strftime("%Y-%m-%d")
+        df[col] = df[col].map(pd.Series(iso.to_numpy(), index=distinct)).astype(iso.dtype)
+    return df
+
+
+def iter_csv_chunks(name: str, path: str, offset: int = 0, end: int | None = None, chunksize: int = CHUNK_ROWS):
+    """
+    Yield typed chunks for the rows stored in bytes [offset, end) of a CSV.
+    A non-zero offset must sit on a line boundary; the header is then taken from the top of the file.
+    """
+    schema = SCHEMAS[name]
+    end = os.path.getsize(path) if end is None else end
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    with io.BufferedReader(_ByteRange(path, offset, end)) as f:
+        reader = pd.read_csv(
+            f,
+            header=0 if offset == 0 else None,
+            names=None if offset == 0 else header,
+            usecols=list(schema),
+            dtype=schema,
+            chunksize=chunksize,
+        )
+        for chunk in reader:
+            yield _convert_dates(name, chunk.reindex(columns=list(schema)))
+
+
+def _insert_frame(conn: sqlite3.Connection, name: str, df: pd.DataFrame):
+    cols = ", ".join(f'"{c}"' for c in df.columns)
+    marks = ", ".join("?" for _ in df.columns)
+    # rows zipped from typed column lists; only columns with missing values go through object
+    columns = [s.astype(object).where(s.notna(), None).tolist() if s.hasnans else s.tolist() for _, s in df.items()]
+    rows = zip(*columns)
+    # re-delivered keys replace the stored row, so re-reading a tail is idempotent
+    verb = "INSERT" if name == "inventory" else "INSERT OR REPLACE"
+    conn.executemany(f'{verb} INTO "{name}" ({cols}) VALUES ({marks})', rows)
+
+
+def _replaced(conn: sqlite3.Connection, name: str, chunk: pd.DataFrame) -> tuple[int, str | None]:
+    """
+    (rows, earliest date) its insert replaces: those already stored under the keys of
+    `chunk`, and its own earlier rows of a key it repeats.
+    """
+    key, (col,) = APPEND_KEYS[name], DATE_COLUMNS[name]
+    count, undated, low = conn.execute(
+        f'SELECT COUNT(*), COUNT(*) - COUNT("{col}"), MIN("{col}") FROM "{name}" '
+        f'WHERE "{key}" IN (SELECT value FROM json_each(?))',
+        (json.dumps(chunk[key].tolist()),),
+    ).fetchone()
+    return count + len(chunk) - chunk[key].nunique(), "" if undated else low
+
+
+def _plan(conn: sqlite3.Connection, name: str, path: str, prev: dict | None) -> tuple[str, int]:
+    """Decide how to bring one table in sync: ('skip'|'append'|'full', byte offset to read from)."""
+    stat = os.stat(path)
+    if prev is None or not _table_exists(conn, name):
+        return "full", 0
+    if prev["mtime"] == stat.st_mtime and prev["size"] == stat.st_size:
+        return "skip", 0
+    if (
+        name in APPEND_ONLY_TABLES
+        and stat.st_size > prev["size"]
+        and _ends_with_newline(path, prev["size"])
+        and _fingerprint(path, prev["size"]) == prev["fingerprint"]
+    ):
+        return "append", prev["size"]
+    return "full", 0
+
+
+def shard_ranges(path: str, start: int, end: int, shard_bytes: int = SHARD_BYTES) -> list[tuple[int, int]]:
+    """
+    Split bytes [start, end) of a CSV into consecutive ranges of about `shard_bytes`,
+    each beginning on a line boundary, so iter_csv_chunks() can parse them independently.
+    """
+    bounds = [start]
+    with open(path, "rb") as f:
+        pos = start + shard_bytes
+        while pos < end:
+            # move the cut past the end of the line it lands in
+            f.seek(pos - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= end:
+                break
+            bounds.append(pos)
+            pos += shard_bytes
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_shard(name: str, path: str, start: int, end: int) -> list[pd.DataFrame]:
+    # runs in a worker process: the typed chunks of one shard, dates already converted
+    return list(iter_csv_chunks(name, path, start, end))
+
+
+def _parsed_shards(pool, shards: list[tuple], lookahead: int):
+    """
+    Chunk iterables of each (name, path, start, end) shard, in order. With a pool the
+    next `lookahead` shards are parsed ahead of the writer; without one they stream inline.
+    """
+    if pool is None:
+        for shard in shards:
+            yield iter_csv_chunks(*shard)
+        return
+    todo = iter(shards)
+    pending = deque(pool.submit(_parse_shard, *shard) for shard in itertools.islice(todo, lookahead))
+    while pending:
+        chunks = pending.popleft().result()
+        for shard in itertools.islice(todo, 1):
+            pending.append(pool.submit(_parse_shard, *shard))
+        yield chunks
+
+
+def _write_table(conn: sqlite3.Connection, name: str, path: str, action: str, prev: dict | None,
+                 stat: os.stat_result, chunks) -> dict:
+    """Load parsed chunks into one table and record its watermark, in a single transaction."""
+    started = time.perf_counter()
+    rows = replaced = 0
+    min_date = None
+    with conn:
+        conn.execute("BEGIN")
+        if action == "full":
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            conn.execute(DDL[name])
+        for index in RETIRED_INDEXES.get(name, []):
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        for chunk in chunks:
+            if action == "append" and name in APPEND_KEYS:
+                # the months replaced rows are taken out of need re-aggregating as well
+                count, low = _replaced(conn, name, chunk)
+                replaced += count
+                if low is not None:
+                    min_date = low if min_date is None else min(min_date, low)
+            _insert_frame(conn, name, chunk)
+            rows += len(chunk)
+            for col in DATE_COLUMNS.get(name, []):
+                # NULL (unparseable) dates sort first so they are rolled up again too
+                low = "" if chunk[col].isna().any() else chunk[col].min()
+                min_date = low if min_date is None else min(min_date, low)
+        # built after a bulk load rather than maintained row by row
+        for ddl in INDEXES.get(name, []):
+            conn.execute(ddl)
+        row_count = (prev["row_count"] if action == "append" else 0) + rows - replaced
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} (table_name, mtime, size, row_count, fingerprint) VALUES (?, ?, ?, ?, ?)",
+            (name, stat.st_mtime, stat.st_size, row_count, _fingerprint(path, stat.st_size)),
+        )
+    seconds = time.perf_counter() - started
+    return {"action": action, "rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else 0.0,
+            "min_date": min_date}
+
+
+_SKIPPED = {"action": "skip", "rows": 0, "seconds": 0.0, "rows_per_sec": 0.0, "min_date": None}
+
+
+def sync_table(conn: sqlite3.Connection, csv_dir: str, name: str, prev: dict | None) -> dict:
+    """Bring one table in line with its CSV. Data and watermark are committed together."""
+    path = csv_path(csv_dir, name)
+    action, offset = _plan(conn, name, path, prev)
+    if action == "skip":
+        return dict(_SKIPPED)
+    # only parse up to the size we record, so rows appended mid-read are picked up next time
+    stat = os.stat(path)
+    return _write_table(conn, name, path, action, prev, stat, iter_csv_chunks(name, path, offset, stat.st_size))
+
+
+def sync_database(conn: sqlite3.Connection, csv_dir: str, tables: list[str] = TABLES,
+                  workers: int = PARSE_WORKERS) -> dict:
+    """
+    Incrementally sync every table: unchanged CSVs are skipped, append-only CSVs load
+    only their new tail, anything else is reloaded in full. Each load is streamed in
+    CHUNK_ROWS chunks and reports its rows/sec throughput.
+
+    When more than SHARD_BYTES need parsing and `workers` > 1, every pending CSV is cut
+    into line-aligned shards parsed by a process pool, across tables at once; this
+    connection stays the only writer and loads the shards in file order.
+    """
+    state = load_state(conn)
+    plans = {}
+    for name in tables:
+        path = csv_path(csv_dir, name)
+        action, offset = _plan(conn, name, path, state.get(name))
+        plans[name] = (path, action, offset, os.stat(path))
+    pending = {name: (offset, stat.st_size) for name, (_, action, offset, stat) in plans.items() if action != "skip"}
+    parallel = workers > 1 and sum(end - offset for offset, end in pending.values()) > SHARD_BYTES
+
+    shards = {name: shard_ranges(plans[name][0], offset, end) if parallel else [(offset, end)]
+              for name, (offset, end) in pending.items()}
+    ordered = [(name, plans[name][0], start, end) for name in pending for start, end in shards[name]]
+    # spawned rather than forked: the app calls this from a threaded server process
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if parallel else None
+    try:
+        # one shard per worker in flight keeps them all busy and bounds what is parsed ahead
+        parsed = _parsed_shards(pool, ordered, workers)
+        results = {}
+        for name in tables:
+            path, action, _, stat = plans[name]
+            if action == "skip":
+                results[name] = dict(_SKIPPED)
+                continue
+            chunks = itertools.chain.from_iterable(next(parsed) for _ in shards[name])
+            results[name] = _write_table(conn, name, path, action, state.get(name), stat, chunks)
+        return results
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def build_rollup(conn: sqlite3.Connection, changes: dict) -> str:
+    """
+    Keep ROLLUP_TABLE in line with sales/products after a sync.
+    A sales append only re-aggregates the months it touched; a products change
+    (prices feed revenue) or a full sales reload rebuilds the whole table.
+    The DEMAND_TABLES are then recomputed from the rollup in the same transaction.
+    Returns 'skip', 'append' or 'full'.
+    """
+    exists = all(_table_exists(conn, t) for t in DERIVED_TABLES)
+    sales, products = changes.get("sales", {}), changes.get("products", {})
+    if exists and sales.get("action", "skip") == "skip" and products.get("action", "skip") == "skip":
+        return "skip"
+    incremental = exists and sales.get("action") == "append" and products.get("action", "skip") == "skip"
+    with conn:
+        conn.execute("BEGIN")
+        if incremental:
+            since = (sales["min_date"] or "")[:7]
+            conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE month >= ? OR month IS NULL", (since,))
+            conn.execute(
+                f"INSERT INTO {ROLLUP_TABLE} {ROLLUP_SELECT} "
+                "WHERE s.sale_date >= ? OR s.sale_date IS NULL GROUP BY 1, 2, 3",
+                (f"{since}-01" if since else "",),
+            )
+        else:
+            conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+            conn.execute(ROLLUP_DDL)
+            conn.execute(f"INSERT INTO {ROLLUP_TABLE} {ROLLUP_SELECT} GROUP BY 1, 2, 3")
+        for ddl in ROLLUP_INDEXES:
+            conn.execute(ddl)
+        _build_demand(conn)
+    return "append" if incremental else "full"
+
+
+def _build_demand(conn: sqlite3.Connection):
+    # one row per product / store x product, so a full rebuild from the rollup stays cheap
+    latest = conn.execute(f"SELECT MAX(month) FROM {ROLLUP_TABLE}").fetchone()[0]
+    recent_after = (pd.Period(latest, "M") - DEMAND_RECENT_MONTHS).strftime("%Y-%m") if latest else None
+    for name, keys in DEMAND_TABLES.items():
+        key_list = ", ".join(keys)
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute(f"CREATE TABLE {name} ({', '.join(f'{k} INTEGER NOT NULL' for k in keys)},{DEMAND_COLUMNS}\n)")
+        conn.execute(f"INSERT INTO {name} {_demand_select(name)}", (recent_after, recent_after, DEMAND_RECENT_MONTHS))
+        conn.execute(f"CREATE UNIQUE INDEX idx_{name} ON {name} ({key_list})")
+
+
+def build_preview(conn: sqlite3.Connection, changes: dict) -> str:
+    """
+    Keep the fast-preview tables in line with sales after a sync. A sales append
+    re-sketches only the months it touched; the stratified sample is redrawn on any
+    sales change, since new sales shift the stratum sizes behind its weights, and
+    whenever it predates the stratum column. Returns 'skip', 'append' or 'full'.
+    """
+    exists = all(_table_exists(conn, t) for t in PREVIEW_TABLES)
+    stratified = exists and "stratum" in {row[1] for row in conn.execute(f"PRAGMA table_info({SAMPLE_TABLE})")}
+    sales = changes.get("sales", {})
+    if stratified and sales.get("action", "skip") == "skip":
+        return "skip"
+    incremental = exists and sales.get("action") == "append"
+    since = (sales.get("min_date") or "")[:7] if incremental else ""
+    with conn:
+        conn.execute("BEGIN")
+        if incremental:
+            conn.execute(f"DELETE FROM {SKETCH_TABLE} WHERE month >= ?", (since,))
+        else:
+            conn.execute(f"DROP TABLE IF EXISTS {SKETCH_TABLE}")
+            conn.execute(SKETCH_DDL)
+        _build_sketches(conn, f"{since}-01" if since else "")
+        conn.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}")
+        conn.execute(f"DROP TABLE IF EXISTS {SAMPLE_PICKED}")
+        conn.execute(SAMPLE_PICK)
+        conn.execute(f"INSERT INTO {SAMPLE_PICKED} {SAMPLE_PICK_SELECT}",
+                     (SAMPLE_CUSTOMERS_PER_STRATUM, SAMPLE_CUSTOMERS_PER_STRATUM))
+        conn.execute(f"CREATE TABLE {SAMPLE_TABLE} AS {SAMPLE_SELECT}")
+        conn.execute(f"DROP TABLE {SAMPLE_PICKED}")
+        conn.execute(f"CREATE INDEX idx_{SAMPLE_TABLE}_customer ON {SAMPLE_TABLE} (customer_id, sale_date)")
+    return "append" if incremental else "full"
+
+
+def _build_sketches(conn: sqlite3.Connection, since: str):
+    # one streamed pass over the dated sales from `since`; registers merge chunk by chunk
+    sketches = {}
+    query = "SELECT strftime('%Y-%m', sale_date) AS month, customer_id FROM sales WHERE sale_date >= ?"
+    for chunk in pd.read_sql_query(query, conn, params=(since,), chunksize=CHUNK_ROWS):
+        for month, g in chunk.groupby("month", sort=False):
+            count, customers = sketches.get(month, (0, None))
+            new_customers = sketch.hll(g["customer_id"].to_numpy())
+            sketches[month] = (
+                count + len(g),
+                new_customers if customers is None else sketch.hll_merge([customers, new_customers]),
+            )
+    conn.executemany(
+        f"INSERT INTO {SKETCH_TABLE} (month, sales, customers) VALUES (?, ?, ?)",
+        [(month, count, sketch.to_blob(c)) for month, (count, c) in sorted(sketches.items())],
+    )
+
+
+def export_parquet(conn: sqlite3.Connection, out_dir: str, changes: dict, rollup: str, preview: str = "skip") -> dict:
+    """
+    Write each COLUMNAR_TABLES table to <out_dir>/<table>.parquet for the columnar engine,
+    skipping tables that didn't change and already have a file. Rows are streamed in
+    CHUNK_ROWS chunks (one row group each, in CLUSTER_KEYS order where set), date
+    columns are stored as real dates, and each file is swapped in atomically so
+    readers never see a half-written export.
+    Returns {table: rows written}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    actions = {name: r["action"] for name, r in changes.items()}
+    for name in DERIVED_TABLES:
+        actions[name] = preview if name in PREVIEW_TABLES else rollup
+    written = {}
+    for name in COLUMNAR_TABLES:
+        path = os.path.join(out_dir, f"{name}.parquet")
+        if actions.get(name, "skip") == "skip" and os.path.exists(path):
+            continue
+        tmp_path = path + ".tmp"
+        writer, rows = None, 0
+        try:
+            order = f" ORDER BY {CLUSTER_KEYS[name]}" if name in CLUSTER_KEYS else ""
+            for chunk in pd.read_sql_query(f"SELECT * FROM {name}{order}", conn, chunksize=CHUNK_ROWS):
+                for col in DATE_COLUMNS.get(name, []):
+                    chunk[col] = pd.to_datetime(chunk[col], format="%Y-%m-%d").dt.date
+                table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:  # empty table: still export its columns
+            empty = pd.read_sql_query(f"SELECT * FROM {name} LIMIT 0", conn)
+            pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+        written[name] = rows
+    return written
+
+
+def record_query_plans(conn: sqlite3.Connection, queries_dir: str, skip_dirs: tuple = ("duckdb",)) -> dict:
+    """
+    Store EXPLAIN QUERY PLAN for every query file in PLAN_TABLE and return
+    {query file: [plan steps that scan a source table without any index]}; scans of
+    the derived tables (rollup, demand, preview) are recorded but not reported.
+    Dialect override directories for other engines (skip_dirs) are left out.
+    """
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {PLAN_TABLE} (
+            query_file TEXT,
+            step INTEGER,
+            detail TEXT,
+            full_scan INTEGER
+        )"""
+    )
+    query_files = []
+    for root, dirs, files in os.walk(queries_dir):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        query_files += [os.path.relpath(os.path.join(root, f), queries_dir).replace(os.sep, "/")
+                        for f in files if f.endswith(".txt")]
+    query_files.sort()
+    full_scans = {}
+    with conn:
+        conn.execute(f"DELETE FROM {PLAN_TABLE}")
+        for fname in query_files:
+            with open(os.path.join(queries_dir, fname), "r", encoding="utf-8") as f:
+                sql = f.read().strip().rstrip(";")
+            ctes = set(re.findall(r"(\w+)\s+AS\s*\(", sql, flags=re.IGNORECASE))
+            aliases = re.findall(r"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", sql, flags=re.IGNORECASE)
+            ctes |= {alias for table, alias in aliases if table in ctes}
+            # the rollup, demand and preview tables are small aggregates meant to be read whole
+            derived = set(DERIVED_TABLES) | {alias for table, alias in aliases if table in DERIVED_TABLES}
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", (None,) * sql.count("?")).fetchall()
+            for step, (_, _, _, detail) in enumerate(plan):
+                words = detail.split()
+                # scanning a CTE, subquery result or derived table is not a scan of the raw data
+                full_scan = (words[0] == "SCAN" and "INDEX" not in detail
+                             and words[1] not in ctes | derived and not words[1].startswith("("))
+                if full_scan:
+                    full_scans.setdefault(fname, []).append(detail)
+                conn.execute(
+                    f"INSERT INTO {PLAN_TABLE} (query_file, step, detail, full_scan) VALUES (?, ?, ?, ?)",
+                    (fname, step, detail, int(full_scan)),
+                )
+    return full_scans
@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+# ─────────────────────────────
+# Query instrumentation
+# ─────────────────────────────
+RECORD_COLUMNS = ["ts", "kind", "name", "ms", "rows", "bytes", "saved_bytes", "cache_hit"]
+SUMMARY_COLUMNS = ["kind", "name", "calls", "hit_rate", "p50_ms", "p95_ms", "max_ms", "rows", "bytes", "saved_bytes"]
+
+
+class QueryLog:
+    """
+    Rolling buffer of timing records (query runs, builds), shared across sessions.
+    Each record is appended to `jsonl_path` as one JSON object per line when set.
+    """
+
+    def __init__(self, max_records: int = 2000, jsonl_path: str | None = None):
+        self.max_records = max_records
+        self.jsonl_path = jsonl_path
+        self._records = deque(maxlen=max_records)
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def name(self, sql: str, name: str):
+        """Label a SQL text with the query file it came from."""
+        with self._lock:
+            self._names[sql] = name
+
+    def name_of(self, sql: str) -> str:
+        with self._lock:
+            return self._names.get(sql, "<inline sql>")
+
+    def record(self, kind: str, name: str, seconds: float, cache_hit: bool, rows: int | None = None,
+               nbytes: int | None = None, saved_bytes: int | None = None):
+        rec = {"ts": time.time(), "kind": kind, "name": name, "ms": seconds * 1000,
+               "rows": rows, "bytes": nbytes, "saved_bytes": saved_bytes, "cache_hit": cache_hit}
+        with self._lock:
+            self._records.append(rec)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec) + "\n")
+
+    def records(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.DataFrame(list(self._records), columns=RECORD_COLUMNS)
+
+    def summary(self) -> pd.DataFrame:
+        """Per (kind, name): calls, cache hit rate, p50/p95/max wall time, last rows, bytes and bytes saved."""
+        df = self.records()
+        if df.empty:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        g = df.groupby(["kind", "name"], sort=False)
+        out = g.agg(calls=("ms", "size"), hit_rate=("cache_hit", "mean"), max_ms=("ms", "max"),
+                    rows=("rows", "last"), bytes=("bytes", "last"), saved_bytes=("saved_bytes", "last"))
+        out["p50_ms"] = g["ms"].quantile(0.50)
+        out["p95_ms"] = g["ms"].quantile(0.95)
+        out = out.reset_index()[SUMMARY_COLUMNS]
+        return out.sort_values("p95_ms", ascending=False).reset_index(drop=True)
@@ -0,0 +1,64 @@
+"""
+Compute every dashboard dataset outside Streamlit and write it to a results
+directory the app reads from. Run it after each data load:
+
+    python precompute.py                      # sync retail_sales.db with csv_files/, then compute
+    python precompute.py --no-sync --out /srv/dashboard/precomputed
+
+The results are tagged with the data version of the CSVs the database was last
+synced from (with --no-sync that may be older than --csv-dir); the app falls
+back to live queries when it doesn't match the current CSVs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import datasets
+import db
+import ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="retail_sales.db")
+    parser.add_argument("--csv-dir", default="csv_files")
+    parser.add_argument("--queries", default="queries")
+    parser.add_argument("--out", default="precomputed", help="results directory")
+    parser.add_argument("--engine", choices=["sqlite", "duckdb"], default="sqlite")
+    parser.add_argument("--columnar-dir", default="columnar", help="Parquet export used by the duckdb engine")
+    parser.add_argument("--no-rollup", action="store_true", help="query raw sales instead of the sales_monthly rollup")
+    parser.add_argument("--no-sync", action="store_true", help="use the database as it is, without syncing the CSVs first")
+    parser.add_argument("--workers", type=int, default=ingest.PARSE_WORKERS, help="CSV parsing processes")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = db.open_writer(args.db)
+    if not args.no_sync:
+        tables = ingest.sync_database(conn, args.csv_dir, workers=args.workers)
+        rollup = ingest.build_rollup(conn, tables)
+        preview = ingest.build_preview(conn, tables)
+        if args.engine == "duckdb":
+            ingest.export_parquet(conn, args.columnar_dir, tables, rollup, preview)
+        synced = [t for t, r in tables.items() if r["action"] != "skip"]
+        print(f"Synced: {', '.join(synced) or 'nothing changed'}", file=sys.stderr)
+    # the version of the data actually in the database, not of whatever is in csv_dir now
+    signature = ingest.synced_signature(conn)
+    conn.close()
+    if signature != ingest.csv_signature(args.csv_dir):
+        print(f"Warning: the database is not in sync with {args.csv_dir}; the app won't use these results "
+              "until it is", file=sys.stderr)
+
+    if args.engine == "duckdb":
+        engine = db.DuckDBEngine(args.columnar_dir)
+    else:
+        engine = db.SQLiteEngine(db.ConnectionPool(args.db))
+    results = datasets.compute_all(engine, args.queries, use_rollup=not args.no_rollup)
+    manifest = datasets.write_results(results, args.out, ingest.data_version(signature))
+
+    print(f"Wrote {len(results)} datasets for data version {manifest['data_version']} to "
+          f"{os.path.abspath(args.out)} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
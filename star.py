@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────
+# In-memory star schema (no Streamlit)
+# ─────────────────────────────
+# Customer revenue aggregated in SQL to one row per customer x month x category,
+# held as NumPy arrays with integer keys into the customer dimension. Built once
+# per version of its tables and shared read-only by every session; the customer
+# views are computed from the arrays. Its size follows customers x months x
+# categories, not the number of sales lines.
+
+TABLES = ("sales", "products", "customers")
+
+# Customer views kept per month window (the date range of the page); oldest dropped first
+WINDOW_VIEWS = 8
+
+CELLS_SQL = """SELECT s.customer_id, CAST(strftime('%Y-%m-01', s.sale_date) AS TEXT) AS order_month, p.category,
+    SUM(s.quantity * p.price) AS revenue, COUNT(*) AS sales
+FROM sales s
+JOIN products p ON p.product_id = s.product_id
+WHERE s.customer_id IS NOT NULL
+GROUP BY s.customer_id, order_month, p.category"""
+
+
+def _readonly(a: np.ndarray) -> np.ndarray:
+    a.flags.writeable = False
+    return a
+
+
+def _dimension(keys: pd.Series, table: pd.DataFrame, key: str) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    (fact codes, dimension rows): codes are positions in the dimension (-1 for NULL
+    keys) and the dimension has one row per distinct key in code order. Keys
+    missing from `table` get NULL attributes and known=False, like a failed join.
+    """
+    codes, uniques = pd.factorize(keys)
+    dim = table.drop_duplicates(key).set_index(key)
+    known = pd.Index(uniques).isin(dim.index)
+    dim = dim.reindex(uniques).reset_index(names=key)
+    dim["known"] = known
+    return codes.astype("int32"), dim
+
+
+def month_code(month: str) -> int:
+    """Month index (year * 12 + month - 1) of a 'YYYY-MM' month."""
+    year, m = month[:7].split("-")
+    return int(year) * 12 + int(m) - 1
+
+
+def _month_codes(dates: pd.Series) -> np.ndarray:
+    """Month index (year * 12 + month - 1) per row, -1 when undated. Each distinct date is parsed once."""
+    codes, uniques = pd.factorize(dates)
+    parsed = pd.to_datetime(pd.Series(uniques), errors="coerce")
+    months = (parsed.dt.year * 12 + parsed.dt.month - 1).fillna(-1).to_numpy(dtype="int32")
+    return np.where(codes >= 0, months[codes], -1).astype("int32")
+
+
+class StarSchema:
+    """
+    Read-only star of customer revenue: one cell per (customer, month, category) over
+    sales of known products (CELLS_SQL), with arrays of customer, month and category
+    codes, revenue and sale counts, and a customer dimension holding names.
+    """
+
+    def __init__(self, cells: pd.DataFrame, customers: pd.DataFrame):
+        customer, self.customers = _dimension(cells["customer_id"], customers, "customer_id")
+
+        # Attributes as integer codes: categories sorted, customers grouped by name
+        category_codes, categories = pd.factorize(cells["category"], sort=True)
+        self.categories = [str(c) for c in categories]
+        name_codes, names = pd.factorize(self.customers["name"].where(self.customers["known"]))
+        self.customer_names = np.asarray(names, dtype=object)
+        self.customer_name = _readonly(name_codes.astype("int32"))
+
+        self.customer = _readonly(customer)
+        self.category = _readonly(category_codes.astype("int16"))
+        self.month = _readonly(_month_codes(cells["order_month"]))
+        self.revenue = _readonly(cells["revenue"].fillna(0).to_numpy(dtype="float64"))
+        self.sales = _readonly(cells["sales"].to_numpy(dtype="int64"))
+
+        self._lock = threading.Lock()
+        self._customer_months = {}
+        self._name_category = {}
+
+    def __len__(self) -> int:
+        return len(self.revenue)
+
+    def nbytes(self) -> int:
+        arrays = [self.customer, self.category, self.month, self.revenue, self.sales, self.customer_name]
+        return sum(a.nbytes for a in arrays) + int(self.customers.memory_usage(index=True, deep=True).sum())
+
+    # ─────────────────────────────
+    # Customer views
+    # ─────────────────────────────
+    # Each view takes an optional (first, last) window of 'YYYY-MM' months, inclusive,
+    # like ingest.restrict_months(); undated sales only count without one.
+    def _in_window(self, months) -> np.ndarray | bool:
+        if months is None:
+            return True
+        return (self.month >= month_code(months[0])) & (self.month <= month_code(months[1]))
+
+    @staticmethod
+    def _remember(views: dict, months, value):
+        views[months] = value
+        while len(views) > WINDOW_VIEWS:
+            views.pop(next(iter(views)))
+
+    def customer_months(self, months=None) -> pd.DataFrame:
+        """
+        Revenue per (customer_id, order_month) over sales of known products, the
+        rows of customer_order_data.txt. Computed once per window; treat it as read-only.
+        """
+        with self._lock:
+            if months not in self._customer_months:
+                keep = np.ones(len(self), dtype=bool) & self._in_window(months)
+                undated = int(self.month.max(initial=-1)) + 1  # month code standing in for NULL dates
+                sale_months = np.where(self.month[keep] >= 0, self.month[keep], undated)
+                key, inverse = np.unique(self.customer[keep].astype("int64") * (undated + 1) + sale_months,
+                                         return_inverse=True)
+                revenue = np.bincount(inverse, weights=self.revenue[keep], minlength=len(key))
+                customer, month = np.divmod(key, undated + 1)
+                codes, month_inverse = np.unique(month, return_inverse=True)
+                labels = np.array([None if m == undated else f"{m // 12:04d}-{m % 12 + 1:02d}-01" for m in codes],
+                                  dtype=object)
+                self._remember(self._customer_months, months, pd.DataFrame({
+                    "customer_id": self.customers["customer_id"].to_numpy()[customer],
+                    "order_month": labels[month_inverse],
+                    "revenue": revenue,
+                }))
+            return self._customer_months[months]
+
+    def _name_category_totals(self, months=None) -> tuple[np.ndarray, np.ndarray]:
+        # (revenue, sale count) per customer name x category, over sales joining all three tables
+        with self._lock:
+            if months not in self._name_category:
+                name = self.customer_name[self.customer]
+                keep = (name >= 0) & (self.category >= 0) & self._in_window(months)
+                n_categories = len(self.categories)
+                cell = name[keep].astype("int64") * n_categories + self.category[keep]
+                size = len(self.customer_names) * n_categories
+                revenue = np.bincount(cell, weights=self.revenue[keep], minlength=size)
+                count = np.bincount(cell, weights=self.sales[keep], minlength=size)
+                self._remember(self._name_category, months, (_readonly(revenue.reshape(-1, n_categories)),
+                                                             _readonly(count.reshape(-1, n_categories))))
+            return self._name_category[months]
+
+    def top_customers(self, categories=None, top_n: int = 5, months=None) -> pd.DataFrame:
+        """analytics.top_customers() over the star: the category list is only built for the winners."""
+        revenue, count = self._name_category_totals(months)
+        cols = [self.categories.index(c) for c in categories if c in self.categories] if categories else \
+            list(range(len(self.categories)))
+        totals = revenue[:, cols].sum(axis=1)
+        bought = (count[:, cols] > 0).any(axis=1)
+        candidates = np.flatnonzero(bought)
+        if len(candidates) > top_n:
+            # everyone tied with the k-th largest total stays in, so ties break by name below
+            kth = np.partition(totals[candidates], len(candidates) - top_n)[len(candidates) - top_n]
+            candidates = candidates[totals[candidates] >= kth]
+        # revenue descending, then name
+        order = np.lexsort((self.customer_names[candidates], -totals[candidates]))
+        winners = candidates[order[:top_n]]
+        labels = np.asarray(self.categories, dtype=object)[cols]
+        return pd.DataFrame({
+            "customer_name": self.customer_names[winners],
+            "total_revenue": totals[winners],
+            "categories": [", ".join(sorted(labels[count[w, cols] > 0])) for w in winners],
+        })
+
+
+def build_star(engine) -> StarSchema:
+    """Aggregate the customer cells through a db engine and build the star schema."""
+    return StarSchema(engine.query(CELLS_SQL), engine.query("SELECT customer_id, name FROM customers"))
@@ -0,0 +1,38 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ingest  # noqa: E402
+
+CSV_DIR = os.path.join(ROOT, "csv_files")
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    """A writable copy of the shipped CSVs."""
+    return shutil.copytree(CSV_DIR, tmp_path / "csv_files")
+
+
+def build(db_path, csv_dir, workers: int = 1) -> tuple[sqlite3.Connection, dict]:
+    """Sync a database the way the app does: tables, then the rollup and the preview tables."""
+    conn = sqlite3.connect(db_path)
+    tables = ingest.sync_database(conn, str(csv_dir), workers=workers)
+    steps = {"tables": tables, "rollup": ingest.build_rollup(conn, tables), "preview": ingest.build_preview(conn, tables)}
+    return conn, steps
+
+
+def table_frame(conn: sqlite3.Connection, name: str) -> pd.DataFrame:
+    """Every row of a table, in a canonical order."""
+    df = pd.read_sql_query(f'SELECT * FROM "{name}"', conn)
+    return sorted_frame(df)
+
+
+def sorted_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(list(df.columns), na_position="first", kind="stable").reset_index(drop=True)
@@ -0,0 +1,68 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+from conftest import CSV_DIR, ROOT, build
+
+
+def reference_low_stock_risk(stock_df: pd.DataFrame, pct: float, cov_threshold: float, categories=None) -> dict:
+    """low_stock_risk() as it was before StockRiskIndex: ranks and flags every row on each call."""
+    d = stock_df if categories is None else stock_df[stock_df["category"].isin(categories)]
+    d = d.copy()
+    d["risk_percentile"] = d.groupby("category", observed=True)["avg_stock"].rank(method="min", pct=True)
+
+    flag_percentile = d["risk_percentile"] <= pct / 100.0
+    flag_coverage = d["stock_coverage"].fillna(0) <= cov_threshold
+
+    d["Risk Reason"] = None
+    d.loc[flag_percentile & ~flag_coverage, "Risk Reason"] = "Percentile"
+    d.loc[~flag_percentile & flag_coverage, "Risk Reason"] = "Coverage"
+    d.loc[flag_percentile & flag_coverage, "Risk Reason"] = "Both"
+
+    at_risk = (d[flag_percentile | flag_coverage]
+               .sort_values(["category", "risk_percentile", "stock_coverage"])
+               .reset_index(drop=True))
+    return {"at_risk": at_risk, "total_skus": len(d)}
+
+
+@pytest.fixture(scope="module")
+def shipped_stock(tmp_path_factory):
+    conn, _ = build(tmp_path_factory.mktemp("stock") / "stock.db", CSV_DIR)
+    with open(os.path.join(ROOT, "queries", "inventory_tab_low_stock_risk.txt"), "r", encoding="utf-8") as f:
+        df = pd.read_sql_query(f.read(), conn)
+    conn.close()
+    return df
+
+
+def synthetic_stock(seed: int = 3) -> pd.DataFrame:
+    # ties in avg_stock and coverage, products without sales (NULL coverage), stock or category
+    rng = np.random.default_rng(seed)
+    n = 400
+    df = pd.DataFrame({
+        "product_name": [f"P{i}" for i in range(n)],
+        "category": rng.choice(["Food", "Toys", "Garden", "Books"], n),
+        "avg_stock": rng.integers(0, 40, n).astype("float64"),
+        "avg_monthly_sales": rng.integers(0, 10, n).astype("float64"),
+    })
+    df.loc[rng.choice(n, 10, replace=False), "avg_stock"] = np.nan
+    df.loc[rng.choice(n, 5, replace=False), "category"] = None
+    df["stock_coverage"] = (df["avg_stock"] / df["avg_monthly_sales"].replace(0, np.nan)).round(1)
+    return df
+
+
+@pytest.mark.parametrize("source", ["shipped", "synthetic"])
+def test_stock_risk_index_matches_reference(source, request):
+    stock = request.getfixturevalue("shipped_stock") if source == "shipped" else synthetic_stock()
+    names = sorted(stock["category"].dropna().unique())
+    selections = [None, names[:1], names[1:3] + ["Missing"], names[::-1], []]
+    index = analytics.StockRiskIndex(stock)
+    for pct, cov_threshold, categories in itertools.product([0, 5, 15, 50, 100], [0.0, 0.5, 1.0, 3.0], selections):
+        case = f"pct={pct} cov={cov_threshold} categories={categories}"
+        expected = reference_low_stock_risk(stock, pct, cov_threshold, categories)
+        got = index.query(pct, cov_threshold, categories)
+        assert got["total_skus"] == expected["total_skus"], case
+        pd.testing.assert_frame_equal(got["at_risk"], expected["at_risk"], check_dtype=False, obj=case)
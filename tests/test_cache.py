@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from cache import DiskCache, ResultCache
+from db import compact_frame
+
+
+def frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"x": range(n)})
+
+
+def test_result_cache_keys_on_table_versions():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return frame(3)
+
+    assert cache.get_or_compute("q", {"sales": "v1"}, compute)[1] is False
+    assert cache.get_or_compute("q", {"sales": "v1"}, compute)[1] is True
+    assert cache.get_or_compute("q", {"sales": "v2"}, compute)[1] is False
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_result_cache_prune_drops_only_changed_tables():
+    cache = ResultCache()
+    cache.get_or_compute("kpi", {"sales": "v1", "products": "p1"}, lambda: frame(1))
+    cache.get_or_compute("stores", {"stores": "s1"}, lambda: frame(1))
+    cache.get_or_compute("old", {"sales": "v0"}, lambda: frame(1))
+
+    assert cache.prune({"sales": "v1", "products": "p1", "stores": "s1"}) == 1
+    assert cache.stats()["entries"] == 2 and cache.stats()["invalidated"] == 1
+    assert cache.prune({"sales": "v2", "products": "p1", "stores": "s1"}) == 1
+    assert cache.get_or_compute("stores", {"stores": "s1"}, lambda: frame(1))[1] is True
+    assert cache.get_or_compute("kpi", {"sales": "v1", "products": "p1"}, lambda: frame(1))[1] is False
+    # a table no longer present counts as changed, and sizes are given back with the entries
+    assert cache.prune({}) == 2
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.get_or_compute("a", {}, lambda: frame(1))
+    cache.get_or_compute("b", {}, lambda: frame(1))
+    cache.get_or_compute("a", {}, lambda: frame(1))  # a is now the most recently used
+    cache.get_or_compute("c", {}, lambda: frame(1))
+    assert cache.get_or_compute("a", {}, lambda: frame(1))[1] is True
+    assert cache.get_or_compute("b", {}, lambda: frame(1))[1] is False
+
+
+def test_result_cache_evicts_by_size():
+    size = ResultCache().get_or_compute_sized("probe", {}, lambda: frame(1000))[2]
+    cache = ResultCache(max_bytes=int(size * 2.5))
+    for key in "abc":
+        cache.get_or_compute(key, {}, lambda: frame(1000))
+    assert cache.stats()["entries"] == 2 and cache.nbytes <= cache.max_bytes
+    assert cache.get_or_compute("a", {}, lambda: frame(1000))[1] is False
+
+
+def test_result_cache_computes_concurrent_misses_once():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return frame(1)
+
+    threads = [threading.Thread(target=cache.get_or_compute, args=("q", {"sales": "v1"}, compute)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 7
+
+
+def compact_result() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "category": ["Food", "Toys", "Food", None] * 25,
+        "store_id": range(100),
+        "revenue": [1.5, 2.25, None, 4.0] * 25,
+        "month": pd.date_range("2024-01-01", periods=100, freq="D").strftime("%Y-%m"),
+    })
+    df = compact_frame(df)
+    df.attrs["source"] = "sales_monthly"
+    return df
+
+
+def test_disk_cache_round_trips_frames_and_attrs(tmp_path):
+    df = compact_result()
+    cache = DiskCache(str(tmp_path), build_version="b1")
+    assert cache.get("q", {"sales": "v1"}) is None
+    cache.put("q", {"sales": "v1"}, df)
+
+    # a new process reads the same files back
+    reopened = DiskCache(str(tmp_path), build_version="b1")
+    assert reopened.nbytes == cache.nbytes > 0
+    got = reopened.get("q", {"sales": "v1"})
+    pd.testing.assert_frame_equal(got, df)
+    assert got.attrs == df.attrs and got.attrs["bytes_saved"] > 0
+    assert reopened.stats()["hits"] == 1
+
+    # other table versions or another build of the code miss
+    assert reopened.get("q", {"sales": "v2"}) is None
+    assert DiskCache(str(tmp_path), build_version="b2").get("q", {"sales": "v1"}) is None
+
+
+def test_disk_cache_evicts_least_recently_used_files(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    for i, key in enumerate("abc"):
+        cache.put(key, {}, compact_result())
+        os.utime(cache._path(key, {}), (1000 + i, 1000 + i))
+    size = os.path.getsize(cache._path("a", {}))
+    cache.get("a", {})  # a hit makes "a" the most recently used
+    cache.max_bytes = int(size * 3.5)
+    cache.put("d", {}, compact_result())
+
+    assert cache.get("b", {}) is None
+    assert all(cache.get(key, {}) is not None for key in "acd")
+    assert cache.stats()["evicted"] == 1
+    assert cache.nbytes == sum(os.path.getsize(os.path.join(tmp_path, f)) for f in os.listdir(tmp_path))
+
+    assert cache.clear() == 3
+    assert cache.nbytes == 0 and cache.get("a", {}) is None
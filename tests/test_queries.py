@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import ingest
+from conftest import CSV_DIR, ROOT, build, sorted_frame
+
+QUERY_DIR = os.path.join(ROOT, "queries")
+
+# The shipped sales run from 2024-06 to 2025-05
+WINDOWS = [("2024-09", "2024-11"), ("2025-01", "2025-01"), ("2025-03", "2025-05")]
+
+
+def query_files() -> dict:
+    """{relative path: SQL} for the SQLite query files."""
+    files = {}
+    for root, dirs, names in os.walk(QUERY_DIR):
+        dirs[:] = [d for d in dirs if d != "duckdb"]
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "r", encoding="utf-8") as f:
+                files[os.path.relpath(path, QUERY_DIR).replace(os.sep, "/")] = f.read()
+    return files
+
+
+# the sample is redrawn from whichever customers are present, so it only matches itself
+QUERIES = {rel: sql for rel, sql in query_files().items() if ingest.SAMPLE_TABLE not in ingest.tables_read(sql)}
+
+
+@pytest.fixture(scope="module")
+def full_db(tmp_path_factory):
+    conn, _ = build(tmp_path_factory.mktemp("full") / "full.db", CSV_DIR)
+    yield conn
+    conn.close()
+
+
+def windowed_db(directory, months: tuple[str, str]):
+    """A database built from sales.csv cut down to the rows dated in `months`."""
+    csv_dir = shutil.copytree(CSV_DIR, directory / "csv_files")
+    sales = pd.read_csv(os.path.join(CSV_DIR, "sales.csv"), dtype=str)
+    month = pd.to_datetime(sales["sale_date"], format=ingest.DATE_FORMAT).dt.strftime("%Y-%m")
+    sales[month.between(*months)].to_csv(os.path.join(csv_dir, "sales.csv"), index=False)
+    conn, _ = build(directory / "window.db", csv_dir)
+    return conn
+
+
+@pytest.mark.parametrize("months", WINDOWS, ids="..".join)
+def test_restrict_months_matches_sales_cut_to_the_window(full_db, tmp_path, months):
+    window = windowed_db(tmp_path, months)
+    store = full_db.execute("SELECT store_name FROM stores ORDER BY store_id LIMIT 1").fetchone()[0]
+    for rel, sql in QUERIES.items():
+        params = ("[]", "[]", 5) if rel == "customer_top_k.txt" else (store,) * sql.count("?")
+        windowed, window_params = ingest.restrict_months(sql, months)
+        got = pd.read_sql_query(windowed, full_db, params=window_params + params)
+        expected = pd.read_sql_query(sql, window, params=params)
+        pd.testing.assert_frame_equal(sorted_frame(got), sorted_frame(expected), check_dtype=False, obj=rel)
+
+
+def test_restrict_months_none_is_the_query_itself():
+    sql = QUERIES["main_kpi_summary.txt"]
+    assert ingest.restrict_months(sql, None) == (sql, ())
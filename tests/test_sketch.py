@@ -0,0 +1,128 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+import ingest
+import sketch
+from conftest import ROOT, build
+
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+from generate_data import generate  # noqa: E402
+
+# Share of trials whose 95% bound must cover the truth: below 0.95 for the misses
+# a few dozen trials show by chance, and for skewed values, where the normal
+# approximation behind the bounds runs a little narrow (about 0.85-0.9 for the
+# lognormal spend below with 50 units per stratum)
+MIN_COVERAGE = 0.8
+
+
+@pytest.mark.parametrize("n", [0, 10, 1_000, 20_000, 200_000])
+def test_hll_count_within_stated_error(n):
+    rng = np.random.default_rng(n)
+    trials = [rng.choice(10 ** 9, n, replace=False) for _ in range(20)]
+    estimates = np.array([sketch.hll_count(sketch.hll(ids)) for ids in trials])
+    bound = sketch.hll_error(sketch.hll(trials[0])) * n
+    assert (np.abs(estimates - n) <= bound).mean() >= MIN_COVERAGE
+    # repeats don't count twice
+    assert sketch.hll_count(sketch.hll(np.concatenate([trials[0], trials[0]]))) == estimates[0]
+
+
+def test_hll_merge_is_the_sketch_of_the_union():
+    rng = np.random.default_rng(1)
+    a, b = rng.choice(10 ** 6, 30_000, replace=False), rng.choice(10 ** 6, 30_000, replace=False)
+    merged = sketch.hll_merge([sketch.hll(a), sketch.hll(b)])
+    np.testing.assert_array_equal(merged, sketch.hll(np.concatenate([a, b])))
+    np.testing.assert_array_equal(sketch.from_blob(sketch.to_blob(merged)), merged)
+
+
+def heavy_tailed_population(rng) -> pd.DataFrame:
+    # strata of very different sizes; values lognormal, as customer spend is
+    sizes = [5_000, 800, 120, 30]
+    return pd.DataFrame({
+        "stratum": np.repeat(np.arange(len(sizes)), sizes),
+        "value": rng.lognormal(3, 1.2, sum(sizes)),
+        "flag": rng.random(sum(sizes)) < 0.3,
+    })
+
+
+def draw(population: pd.DataFrame, rng, per_stratum: int) -> pd.DataFrame:
+    """Per stratum: size, units sampled and the sampled sums the estimators take."""
+    shuffled = population.iloc[rng.permutation(len(population))]
+    sample = shuffled[shuffled.groupby("stratum").cumcount() < per_stratum]
+    sizes = population.groupby("stratum").size().rename("size")
+    return sample.assign(value_sq=sample["value"] ** 2).groupby("stratum").agg(
+        sampled=("value", "size"), value=("value", "sum"), value_sq=("value_sq", "sum"), hits=("flag", "sum"),
+    ).join(sizes)
+
+
+def test_stratified_estimators_within_stated_error():
+    rng = np.random.default_rng(7)
+    population = heavy_tailed_population(rng)
+    true_total, true_share = population["value"].sum(), population["flag"].mean()
+    totals, shares = [], []
+    for _ in range(100):
+        s = draw(population, rng, per_stratum=50)
+        totals.append(sketch.stratified_total(s["size"], s["sampled"], s["value"], s["value_sq"]))
+        shares.append(sketch.stratified_share(s["size"], s["sampled"], s["hits"]))
+    totals, shares = np.array(totals), np.array(shares)
+
+    assert (np.abs(totals[:, 0] - true_total) <= totals[:, 1]).mean() >= MIN_COVERAGE
+    assert (np.abs(shares[:, 0] - true_share) <= shares[:, 1]).mean() >= MIN_COVERAGE
+    # unbiased: the mean of 100 estimates is well inside one estimate's bound
+    assert abs(totals[:, 0].mean() - true_total) <= totals[:, 1].mean() / 3
+    assert abs(shares[:, 0].mean() - true_share) <= shares[:, 1].mean() / 3
+
+
+def test_stratified_total_is_exact_when_every_unit_is_kept():
+    population = heavy_tailed_population(np.random.default_rng(2))
+    s = draw(population, np.random.default_rng(3), per_stratum=10 ** 6)
+    total, error = sketch.stratified_total(s["size"], s["sampled"], s["value"], s["value_sq"])
+    assert total == pytest.approx(population["value"].sum()) and error == 0
+
+
+@pytest.fixture(scope="module")
+def generated_db(tmp_path_factory):
+    # Zipf-distributed customers, so a few heavy buyers carry much of the revenue
+    directory = tmp_path_factory.mktemp("generated")
+    generate(str(directory / "csv_files"), 100_000)
+    with pytest.MonkeyPatch.context() as patch:
+        # about a tenth of the 5,000 customers, as a sample of a production table would be
+        patch.setattr(ingest, "SAMPLE_CUSTOMERS_PER_STRATUM", 10)
+        conn, _ = build(directory / "generated.db", directory / "csv_files")
+    yield conn
+    conn.close()
+
+
+def run(conn, name: str, months=None) -> pd.DataFrame:
+    with open(os.path.join(ROOT, "queries", f"{name}.txt"), "r", encoding="utf-8") as f:
+        sql, params = ingest.restrict_months(f.read(), months)
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+@pytest.mark.parametrize("months", [None, ("2025-01", "2025-06")], ids=["all", "half"])
+def test_preview_within_stated_error(generated_db, months):
+    sample = run(generated_db, "preview/customer_order_data", months)
+    sketches = run(generated_db, "preview/sales_sketch", months)
+    # a sample, not every sale
+    assert generated_db.execute(f"SELECT COUNT(*) FROM {ingest.SAMPLE_TABLE}").fetchone()[0] < 50_000
+
+    exact_kpi = run(generated_db, "main_kpi_summary", months)
+    kpi = analytics.preview_kpi(sample, sketches).merge(exact_kpi, on="month_year", suffixes=("", "_exact"))
+    assert len(kpi) == (24 if months is None else 6)
+    for col in ("total_revenue", "units_sold", "average_order_value"):
+        miss = (kpi[col] - kpi[f"{col}_exact"]).abs()
+        assert (miss <= kpi[f"{col}_error"]).mean() >= MIN_COVERAGE, col
+        # and the typical miss is well inside the typical bound (about 0.4 of it for a normal error)
+        assert miss.mean() <= 0.6 * kpi[f"{col}_error"].mean(), col
+        # bounds narrow enough to be worth showing (about 18% here; a sample missing the
+        # heavy buyers needs over 150% to still cover)
+        assert (kpi[f"{col}_error"] / kpi[f"{col}_exact"]).mean() < 0.3, col
+
+    estimate = analytics.preview_customer_metrics(sample, sketches)
+    exact = analytics.customer_metrics(run(generated_db, "customer_order_data", months))
+    for key in ("total_customers", "repeat_rate"):
+        assert abs(estimate[key] - exact[key]) <= estimate[f"{key}_error"], key